@@ -0,0 +1,26 @@
+"""outbox delivered recipients
+
+Revision ID: 3f5c8a1d7e42
+Revises: 7b1e4f9a2c58
+Create Date: 2026-10-18 19:40:12.583104
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f5c8a1d7e42'
+down_revision: Union[str, None] = '7b1e4f9a2c58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('notification_outbox', sa.Column('delivered', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('notification_outbox', 'delivered')
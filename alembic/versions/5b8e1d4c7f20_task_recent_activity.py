@@ -0,0 +1,27 @@
+"""task recent activity snapshot
+
+Revision ID: 5b8e1d4c7f20
+Revises: c41f0e7a9b2d
+Create Date: 2026-10-18 12:31:07.224815
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e1d4c7f20'
+down_revision: Union[str, None] = 'c41f0e7a9b2d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # снимок заполняется при первой отправке карточки задачи (telegram_bot.utils.send_tasks.check_task)
+    op.add_column('tasks', sa.Column('recent_activity', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('tasks', 'recent_activity')
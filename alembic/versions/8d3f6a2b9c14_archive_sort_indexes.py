@@ -0,0 +1,42 @@
+"""archive sort indexes
+
+Revision ID: 8d3f6a2b9c14
+Revises: 5b8e1d4c7f20
+Create Date: 2026-10-18 14:05:52.903716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3f6a2b9c14'
+down_revision: Union[str, None] = '5b8e1d4c7f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_tasks_time_updated_id', 'tasks', ['time_updated', 'id'], unique=False)
+    op.create_index('ix_tasks_plan_date_id', 'tasks', ['actual_plan_date', 'id'], unique=False)
+    op.create_index('ix_tasks_task_type_id_id', 'tasks', ['task_type_id', 'id'], unique=False)
+    op.create_index('ix_tasks_object_id_id', 'tasks', ['object_id', 'id'], unique=False)
+    op.create_index('ix_tasks_supplier_id_id', 'tasks', ['supplier_id', 'id'], unique=False)
+    op.create_index('ix_tasks_supervisor_id_id', 'tasks', ['supervisor_id', 'id'], unique=False)
+    op.create_index('ix_tasks_executor_id_id', 'tasks', ['executor_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    # для task_type_id и object_id MySQL мог удалить неявный индекс внешнего ключа,
+    # поэтому перед удалением составных возвращаем одиночные (см. c41f0e7a9b2d)
+    op.drop_index('ix_tasks_executor_id_id', table_name='tasks')
+    op.drop_index('ix_tasks_supervisor_id_id', table_name='tasks')
+    op.drop_index('ix_tasks_supplier_id_id', table_name='tasks')
+    op.create_index('ix_tasks_object_id', 'tasks', ['object_id'], unique=False)
+    op.drop_index('ix_tasks_object_id_id', table_name='tasks')
+    op.create_index('ix_tasks_task_type_id', 'tasks', ['task_type_id'], unique=False)
+    op.drop_index('ix_tasks_task_type_id_id', table_name='tasks')
+    op.drop_index('ix_tasks_plan_date_id', table_name='tasks')
+    op.drop_index('ix_tasks_time_updated_id', table_name='tasks')
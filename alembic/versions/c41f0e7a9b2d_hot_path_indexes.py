@@ -0,0 +1,52 @@
+"""hot path indexes
+
+Revision ID: c41f0e7a9b2d
+Revises: 53d2d46d992e
+Create Date: 2026-10-18 10:12:41.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41f0e7a9b2d'
+down_revision: Union[str, None] = '53d2d46d992e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_tasks_supplier_status_plan_date', 'tasks',
+                    ['supplier_id', 'status', 'actual_plan_date'], unique=False)
+    op.create_index('ix_tasks_supervisor_status_plan_date', 'tasks',
+                    ['supervisor_id', 'status', 'actual_plan_date'], unique=False)
+    op.create_index('ix_tasks_executor_status_plan_date', 'tasks',
+                    ['executor_id', 'status', 'actual_plan_date'], unique=False)
+    op.create_index('ix_tasks_status_plan_date', 'tasks',
+                    ['status', 'actual_plan_date'], unique=False)
+    op.create_index('ix_task_notifications_task_user_active', 'task_notifications',
+                    ['task_id', 'user_id', 'active', 'telegram_message_id'], unique=False)
+    op.create_index('ix_task_notifications_message_user_active', 'task_notifications',
+                    ['telegram_message_id', 'user_id', 'active'], unique=False)
+    op.create_index('ix_comments_task_time_created', 'comments',
+                    ['task_id', 'time_created'], unique=False)
+
+
+def downgrade() -> None:
+    # MySQL мог удалить неявные индексы внешних ключей, когда появились составные индексы
+    # с тем же первым столбцом, поэтому перед удалением составных возвращаем одиночные.
+    op.create_index('ix_comments_task_id', 'comments', ['task_id'], unique=False)
+    op.drop_index('ix_comments_task_time_created', table_name='comments')
+    op.drop_index('ix_task_notifications_message_user_active', table_name='task_notifications')
+    op.create_index('ix_task_notifications_task_id', 'task_notifications', ['task_id'], unique=False)
+    op.drop_index('ix_task_notifications_task_user_active', table_name='task_notifications')
+    op.drop_index('ix_tasks_status_plan_date', table_name='tasks')
+    op.create_index('ix_tasks_executor_id', 'tasks', ['executor_id'], unique=False)
+    op.drop_index('ix_tasks_executor_status_plan_date', table_name='tasks')
+    op.create_index('ix_tasks_supervisor_id', 'tasks', ['supervisor_id'], unique=False)
+    op.drop_index('ix_tasks_supervisor_status_plan_date', table_name='tasks')
+    op.create_index('ix_tasks_supplier_id', 'tasks', ['supplier_id'], unique=False)
+    op.drop_index('ix_tasks_supplier_status_plan_date', table_name='tasks')
@@ -0,0 +1,31 @@
+"""fulltext search
+
+Revision ID: e2a7c9d14b63
+Revises: 8d3f6a2b9c14
+Create Date: 2026-10-18 15:20:14.377102
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2a7c9d14b63'
+down_revision: Union[str, None] = '8d3f6a2b9c14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # InnoDB обновляет FULLTEXT-индексы сам при вставке и изменении строк
+    op.create_index('ft_tasks_description', 'tasks', ['description'], unique=False, mysql_prefix='FULLTEXT')
+    op.create_index('ft_comments_content', 'comments', ['content'], unique=False, mysql_prefix='FULLTEXT')
+    op.create_index('ft_documents_title', 'documents', ['title'], unique=False, mysql_prefix='FULLTEXT')
+
+
+def downgrade() -> None:
+    op.drop_index('ft_documents_title', table_name='documents')
+    op.drop_index('ft_comments_content', table_name='comments')
+    op.drop_index('ft_tasks_description', table_name='tasks')
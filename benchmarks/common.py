@@ -0,0 +1,77 @@
+import argparse
+import statistics
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+DEFAULT_URL = "sqlite+aiosqlite:///benchmarks/bench.sqlite3"
+
+
+def base_parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--url', default=DEFAULT_URL,
+                        help="URL отдельной БД для замеров (не рабочей!), по умолчанию локальный SQLite")
+    parser.add_argument('--repeat', type=int, default=20, help="Количество повторов каждого замера")
+    return parser
+
+
+def make_engine(url: str) -> AsyncEngine:
+    return create_async_engine(url, future=True)
+
+
+def make_sessionmaker(engine: AsyncEngine) -> async_sessionmaker[AsyncSession]:
+    return async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def measure(func: Callable[[], Awaitable], repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[max(0, int(len(timings) * 0.95) - 1)], 3),
+    }
+
+
+class StatementCollector:
+    """Собирает SQL, который реально уходит в БД, чтобы строить EXPLAIN по живым запросам."""
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.statements: list[tuple[str, object]] = []
+        self._active = False
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._active:
+            self.statements.append((statement, parameters))
+
+    @contextmanager
+    def collect(self):
+        self.statements = []
+        self._active = True
+        try:
+            yield self.statements
+        finally:
+            self._active = False
+
+
+async def explain(engine: AsyncEngine, statement: str, parameters) -> list[str]:
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == 'sqlite' else "EXPLAIN "
+    async with engine.connect() as conn:
+        result = await conn.exec_driver_sql(prefix + statement, parameters)
+        return [" | ".join(str(value) for value in row) for row in result.all()]
+
+
+def print_table(rows: list[dict], columns: list[str]):
+    widths = {c: max(len(c), *(len(str(r.get(c, ''))) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row.get(c, '')).ljust(widths[c]) for c in columns))
@@ -0,0 +1,270 @@
+"""
+Подменный Telegram Bot API для нагрузочных прогонов бота без Telegram.
+
+    python -m benchmarks.fake_telegram --port 8081 --latency-ms 40 --jitter-ms 20 --error-rate 0.01
+
+Бот направляется на сервер через TelegramAPIServer.from_base("http://127.0.0.1:8081"), см. benchmarks.bot_load.
+Реализованы методы, которыми пользуется бот: sendMessage, editMessageText, editMessageReplyMarkup,
+deleteMessage, getUpdates, getUserProfilePhotos, getFile (и скачивание файла), а также
+getMe, setMyCommands и answerCallbackQuery. Сообщения хранятся в памяти, чтобы правка или удаление
+несуществующего сообщения отвечали ошибкой, как настоящий API.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter, deque
+from typing import Optional
+
+from aiohttp import web
+
+UPDATES_LIMIT = 100
+# заглушка фотографии профиля: маркеры начала и конца JPEG, размер как у маленькой аватарки
+PROFILE_PHOTO = b"\xff\xd8\xff\xe0" + bytes(2 * 1024) + b"\xff\xd9"
+# методы, которые не отвечают 429: опрос обновлений и служебные вызовы при запуске
+NO_THROTTLE_METHODS = {'getupdates', 'getme', 'setmycommands'}
+
+
+class TelegramApiError(Exception):
+    def __init__(self, code: int, description: str, parameters: Optional[dict] = None):
+        self.code = code
+        self.description = description
+        self.parameters = parameters
+
+
+class FakeTelegram:
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                 retry_after: int = 1, random_seed: int = 42):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.rnd = random.Random(random_seed)
+        self.messages: dict[tuple[int, int], dict] = {}
+        self.last_message_id = 0
+        self.updates: deque[dict] = deque()
+        self.last_update_id = 0
+        self._new_updates = asyncio.Event()
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.failed = Counter()
+        self.handlers = {
+            'getme': self.get_me,
+            'setmycommands': self.set_my_commands,
+            'getupdates': self.get_updates,
+            'sendmessage': self.send_message,
+            'editmessagetext': self.edit_message_text,
+            'editmessagereplymarkup': self.edit_message_reply_markup,
+            'deletemessage': self.delete_message,
+            'answercallbackquery': self.answer_callback_query,
+            'getuserprofilephotos': self.get_user_profile_photos,
+            'getfile': self.get_file,
+        }
+
+    # --- для нагрузочного стенда ---
+
+    def add_message(self, chat_id: int, message_id: Optional[int] = None, text: str = "") -> int:
+        # сообщение, которое бот якобы отправил раньше (например, карточка задачи из БД)
+        if message_id is None:
+            message_id = self.last_message_id + 1
+        self.last_message_id = max(self.last_message_id, message_id)
+        self.messages[(chat_id, message_id)] = {'text': text}
+        return message_id
+
+    def push_update(self, update: dict) -> int:
+        self.last_update_id += 1
+        self.updates.append({**update, 'update_id': self.last_update_id})
+        self._new_updates.set()
+        return self.last_update_id
+
+    def stats(self) -> dict:
+        return {'calls': dict(self.calls), 'throttled': dict(self.throttled), 'failed': dict(self.failed),
+                'messages': len(self.messages)}
+
+    # --- сервер ---
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        app.router.add_get('/bot{token}/{method}', self.handle)
+        app.router.add_get('/file/bot{token}/{path:.*}', self.download_file)
+        return app
+
+    async def _params(self, request: web.Request) -> dict:
+        if request.content_type == 'application/json':
+            return await request.json()
+        form = await request.post() if request.can_read_body else request.query
+        params = {}
+        for key, value in form.items():
+            if isinstance(value, web.FileField):
+                continue
+            # aiogram кладёт вложенные объекты (reply_markup) JSON-строкой
+            params[key] = json.loads(value) if value[:1] in ('{', '[') else value
+        return params
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method'].lower()
+        handler = self.handlers.get(method)
+        if handler is None:
+            return self._error(TelegramApiError(404, "Not Found: method not found"))
+        self.calls[method] += 1
+        params = await self._params(request)
+        try:
+            if method not in NO_THROTTLE_METHODS:
+                await self._delay()
+                if self.error_rate and self.rnd.random() < self.error_rate:
+                    self.throttled[method] += 1
+                    raise TelegramApiError(429, f"Too Many Requests: retry after {self.retry_after}",
+                                           {'retry_after': self.retry_after})
+            result = await handler(request, params)
+        except TelegramApiError as e:
+            if e.code != 429:
+                self.failed[method] += 1
+            return self._error(e)
+        return web.json_response({'ok': True, 'result': result})
+
+    async def _delay(self):
+        delay = self.latency + self.rnd.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _error(e: TelegramApiError) -> web.Response:
+        data = {'ok': False, 'error_code': e.code, 'description': e.description}
+        if e.parameters:
+            data['parameters'] = e.parameters
+        return web.json_response(data, status=e.code)
+
+    @staticmethod
+    def _bot_id(request: web.Request) -> int:
+        return int(request.match_info['token'].split(':')[0])
+
+    def _message(self, request: web.Request, chat_id: int, message_id: int, text: str,
+                 reply_markup: Optional[dict] = None) -> dict:
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': self._bot_id(request), 'is_bot': True, 'first_name': "Bot"},
+            'text': text,
+        }
+        if reply_markup and 'inline_keyboard' in reply_markup:
+            message['reply_markup'] = reply_markup
+        return message
+
+    def _stored(self, params: dict, action: str) -> tuple[tuple[int, int], dict]:
+        key = (int(params['chat_id']), int(params['message_id']))
+        if key not in self.messages:
+            raise TelegramApiError(400, f"Bad Request: message to {action} not found")
+        return key, self.messages[key]
+
+    # --- методы API ---
+
+    async def get_me(self, request: web.Request, params: dict) -> dict:
+        return {'id': self._bot_id(request), 'is_bot': True, 'first_name': "Bot", 'username': "fake_bot",
+                'can_join_groups': False, 'can_read_all_group_messages': False, 'supports_inline_queries': False}
+
+    async def set_my_commands(self, request: web.Request, params: dict) -> bool:
+        return True
+
+    async def get_updates(self, request: web.Request, params: dict) -> list[dict]:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or UPDATES_LIMIT)
+        # подтверждённые обновления больше не отдаём
+        while self.updates and self.updates[0]['update_id'] < offset:
+            self.updates.popleft()
+        if not self.updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        return list(self.updates)[:limit]
+
+    async def send_message(self, request: web.Request, params: dict) -> dict:
+        if not params.get('text'):
+            raise TelegramApiError(400, "Bad Request: message text is empty")
+        chat_id = int(params['chat_id'])
+        message_id = self.add_message(chat_id, text=params['text'])
+        return self._message(request, chat_id, message_id, params['text'], params.get('reply_markup'))
+
+    async def edit_message_text(self, request: web.Request, params: dict) -> dict:
+        (chat_id, message_id), stored = self._stored(params, 'edit')
+        if stored['text'] == params['text'] and stored.get('reply_markup') == params.get('reply_markup'):
+            raise TelegramApiError(400, "Bad Request: message is not modified")
+        stored.update(text=params['text'], reply_markup=params.get('reply_markup'))
+        return self._message(request, chat_id, message_id, params['text'], params.get('reply_markup'))
+
+    async def edit_message_reply_markup(self, request: web.Request, params: dict) -> dict:
+        (chat_id, message_id), stored = self._stored(params, 'edit')
+        stored['reply_markup'] = params.get('reply_markup')
+        return self._message(request, chat_id, message_id, stored['text'], params.get('reply_markup'))
+
+    async def delete_message(self, request: web.Request, params: dict) -> bool:
+        key, _ = self._stored(params, 'delete')
+        del self.messages[key]
+        return True
+
+    async def answer_callback_query(self, request: web.Request, params: dict) -> bool:
+        return True
+
+    async def get_user_profile_photos(self, request: web.Request, params: dict) -> dict:
+        user_id = int(params['user_id'])
+        return {'total_count': 1, 'photos': [[{
+            'file_id': f"photo{user_id}", 'file_unique_id': f"u{user_id}", 'width': 1, 'height': 1,
+            'file_size': len(PROFILE_PHOTO),
+        }]]}
+
+    async def get_file(self, request: web.Request, params: dict) -> dict:
+        file_id = params['file_id']
+        return {'file_id': file_id, 'file_unique_id': f"u{file_id}", 'file_size': len(PROFILE_PHOTO),
+                'file_path': f"photos/{file_id}.jpg"}
+
+    async def download_file(self, request: web.Request) -> web.Response:
+        self.calls['download'] += 1
+        await self._delay()
+        return web.Response(body=PROFILE_PHOTO, content_type='image/jpeg')
+
+
+async def start_server(fake: FakeTelegram, host: str = '127.0.0.1', port: int = 0) -> tuple[web.AppRunner, str]:
+    """Запускает сервер в текущем цикле событий, возвращает runner и базовый URL (port=0 - свободный порт)."""
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}"
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency-ms', type=float, default=30, help="Задержка ответа API")
+    parser.add_argument('--jitter-ms', type=float, default=10, help="Разброс задержки, ±")
+    parser.add_argument('--error-rate', type=float, default=0, help="Доля ответов 429 Too Many Requests")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after в ответах 429, секунды")
+
+
+def from_arguments(args: argparse.Namespace) -> FakeTelegram:
+    return FakeTelegram(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                        retry_after=args.retry_after)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Подменный Telegram Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fake = from_arguments(args)
+    runner, url = await start_server(fake, args.host, args.port)
+    print(f"Fake Bot API: {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        print(fake.stats())
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,141 @@
+"""
+Замер горячих запросов без индексов и с индексами из ревизии c41f0e7a9b2d.
+
+    python -m benchmarks.indexes --url sqlite+aiosqlite:///benchmarks/bench.sqlite3 --tasks 100000
+
+Для каждого запроса печатается EXPLAIN реально выполненного SQL и время (min / медиана / p95).
+"""
+import asyncio
+from datetime import date
+
+from sqlalchemy import inspect, text, select, func, desc
+
+from benchmarks.common import (base_parser, make_engine, make_sessionmaker, measure, StatementCollector,
+                               explain, print_table)
+from benchmarks.seed import create_schema, is_seeded, seed
+from database.models import Task, TaskNotification, Comment
+from shared.db import (get_user_tasks, get_notifications, get_notification_by_message, get_task_by_id,
+                       get_deadline_tasks_query)
+
+HOT_PATH_INDEXES = [*Task.__table__.indexes, *TaskNotification.__table__.indexes, *Comment.__table__.indexes]
+
+# До миграции внешние ключи держатся на одиночных индексах (в MySQL они создаются неявно),
+# поэтому замер "до" проводим именно с ними.
+FOREIGN_KEY_INDEXES = {
+    'ix_tasks_supplier_id': ('tasks', 'supplier_id'),
+    'ix_tasks_supervisor_id': ('tasks', 'supervisor_id'),
+    'ix_tasks_executor_id': ('tasks', 'executor_id'),
+    'ix_task_notifications_task_id': ('task_notifications', 'task_id'),
+    'ix_comments_task_id': ('comments', 'task_id'),
+}
+
+SCENARIOS = {
+    'get_user_tasks': lambda db, s: get_user_tasks(s['user_id'], db),
+    'deadline_scan': lambda db, s: _deadline_scan(db),
+    'get_notifications': lambda db, s: get_notifications(s['task_id'], s['notified_user_id'], db),
+    'reply_lookup': lambda db, s: get_notification_by_message(s['message_id'], s['notified_user_id'], db),
+    'task_comments': lambda db, s: get_task_by_id(s['task_id'], db),
+}
+
+
+async def _deadline_scan(db):
+    return (await db.execute(get_deadline_tasks_query(date.today()))).unique().scalars().all()
+
+
+def _existing_indexes(sync_conn) -> set[str]:
+    inspector = inspect(sync_conn)
+    return {index['name'] for table in ('tasks', 'task_notifications', 'comments')
+            for index in inspector.get_indexes(table)}
+
+
+async def set_hot_path_indexes(engine, enabled: bool):
+    async with engine.begin() as conn:
+        existing = await conn.run_sync(_existing_indexes)
+        for name, (table, column) in FOREIGN_KEY_INDEXES.items():
+            if name not in existing:
+                await conn.execute(text(f"CREATE INDEX {name} ON {table} ({column})"))
+        for index in HOT_PATH_INDEXES:
+            if enabled and index.name not in existing:
+                await conn.run_sync(index.create)
+            elif not enabled and index.name in existing:
+                await conn.run_sync(index.drop)
+        if engine.dialect.name == 'sqlite':
+            await conn.execute(text("ANALYZE"))
+        else:
+            await conn.execute(text("ANALYZE TABLE tasks, task_notifications, comments"))
+
+
+async def pick_samples(sessionmaker) -> dict:
+    async with sessionmaker() as db:
+        user_id = (await db.execute(
+            select(Task.executor_id).group_by(Task.executor_id).order_by(desc(func.count(Task.id))).limit(1)
+        )).scalar()
+        notification = (await db.execute(
+            select(TaskNotification).filter(TaskNotification.active).order_by(TaskNotification.id).offset(
+                select(func.count(TaskNotification.id)).scalar_subquery() / 2).limit(1)
+        )).scalar()
+        return {
+            'user_id': user_id,
+            'task_id': notification.task_id,
+            'notified_user_id': notification.user_id,
+            'message_id': notification.telegram_message_id,
+        }
+
+
+async def run_phase(engine, sessionmaker, samples: dict, repeat: int, show_plans: bool) -> dict:
+    collector = StatementCollector(engine)
+    results = {}
+    for name, scenario in SCENARIOS.items():
+        async with sessionmaker() as db:
+            with collector.collect() as statements:
+                await scenario(db, samples)
+
+        async def run():
+            async with sessionmaker() as session:
+                await scenario(session, samples)
+
+        results[name] = await measure(run, repeat)
+        results[name]['queries'] = len(statements)
+        if show_plans:
+            print(f"\n--- {name}")
+            for statement, parameters in statements:
+                print(statement.strip().splitlines()[0][:120], "...")
+                for line in await explain(engine, statement, parameters):
+                    print("    ", line)
+    return results
+
+
+async def main():
+    parser = base_parser("EXPLAIN и время горячих запросов до/после индексов")
+    parser.add_argument('--tasks', type=int, default=100_000, help="Размер синтетической БД, если она пуста")
+    parser.add_argument('--no-plans', action='store_true', help="Не печатать EXPLAIN")
+    args = parser.parse_args()
+
+    engine = make_engine(args.url)
+    sessionmaker = make_sessionmaker(engine)
+    await create_schema(engine)
+    if not await is_seeded(engine):
+        print("Наполняем БД:", await seed(engine, tasks=args.tasks))
+    samples = await pick_samples(sessionmaker)
+    print("Параметры запросов:", samples)
+
+    summary = {}
+    for phase, enabled in (('без индексов', False), ('с индексами', True)):
+        print(f"\n===== {phase}")
+        await set_hot_path_indexes(engine, enabled)
+        summary[phase] = await run_phase(engine, sessionmaker, samples, args.repeat, not args.no_plans)
+
+    before, after = summary.values()
+    print()
+    print_table([
+        {'query': name,
+         'before_ms': before[name]['median_ms'],
+         'after_ms': after[name]['median_ms'],
+         'speedup': f"x{before[name]['median_ms'] / max(after[name]['median_ms'], 0.001):.1f}"}
+        for name in SCENARIOS
+    ], ['query', 'before_ms', 'after_ms', 'speedup'])
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
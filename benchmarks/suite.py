@@ -0,0 +1,257 @@
+"""
+Набор замеров горячих путей. Результаты пишутся в JSON, чтобы сравнивать коммиты между собой.
+
+    python -m benchmarks.seed --url sqlite+aiosqlite:///benchmarks/bench.sqlite3 --tasks 100000
+    python -m benchmarks.suite --url sqlite+aiosqlite:///benchmarks/bench.sqlite3
+    python -m benchmarks.suite --url sqlite+aiosqlite:///benchmarks/bench.sqlite3 \\
+        --compare benchmarks/results/<коммит>.json
+
+Сравнение выходит с кодом 1, если медиана какого-либо замера выросла больше, чем на --threshold.
+Замеры идут мимо Redis-кэша задач, чтобы результат не зависел от того, поднят ли он локально.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable
+from unittest import mock
+
+import httpx
+from fastapi import FastAPI, Request
+from sqlalchemy import select, func, desc
+
+import shared.db
+from benchmarks.common import base_parser, make_engine, make_sessionmaker, measure, StatementCollector, print_table
+from benchmarks.seed import create_schema, is_seeded, seed
+from benchmarks.user_tasks import pick_multi_role_users
+from database import get_read_db
+from database.models import Task, Comment, User, COMPLETED_STATUSES
+from shared.cache import TaskCache, redis_cache, task_cache
+from shared.db import get_task_by_id, get_user_tasks
+from telegram_bot.utils.keyboards import generate_status_keyboard
+from telegram_bot.utils.send_tasks import get_telegram_task_text, check_task
+from webapp.endpoints import tasks as tasks_endpoints, tasks_archive
+from webapp.endpoints.tasks_archive import iter_export_rows, write_csv, write_xlsx
+
+RESULTS_DIR = Path(__file__).parent / "results"
+# чистые функции отрабатывают за микросекунды, их повторяем чаще
+MICRO_REPEAT_FACTOR = 50
+
+
+class NoTaskCache(TaskCache):
+    async def get(self, task_id, version):
+        self.misses += 1
+        return None, ""
+
+    async def set(self, task_id, version, comments, generation):
+        pass
+
+
+@contextmanager
+def without_task_cache():
+    with mock.patch.object(shared.db, 'task_cache', NoTaskCache(redis_cache, task_cache.schema)):
+        yield
+
+
+def current_commit() -> str:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f"{commit}-dirty" if dirty else commit
+
+
+def archive_app(sessionmaker, user: User) -> FastAPI:
+    # роутеры архива и задач (на них ссылается шаблон) без авторизации, сессия - из БД замеров
+    app = FastAPI()
+    app.include_router(tasks_endpoints.router, prefix='/tasks')
+    app.include_router(tasks_archive.router, prefix='/tasks_archive')
+
+    async def bench_db():
+        async with sessionmaker() as session:
+            yield session
+
+    app.dependency_overrides[get_read_db] = bench_db
+
+    @app.middleware('http')
+    async def middleware(request: Request, call_next):
+        request.state.user = user
+        request.state.title = "Все задачи"
+        return await call_next(request)
+
+    return app
+
+
+async def pick_tasks(sessionmaker, random_seed: int) -> dict[str, int]:
+    async with sessionmaker() as db:
+        heavy = await db.scalar(
+            select(Comment.task_id).group_by(Comment.task_id).order_by(desc(func.count())).limit(1))
+        active = (await db.execute(
+            select(Task.id).filter(~Task.status.in_(COMPLETED_STATUSES)).order_by(Task.id)
+        )).scalars().all()
+        total = await db.scalar(select(func.count(Task.id)))
+    return {'heavy': heavy, 'typical': random.Random(random_seed).choice(active), 'middle': total // 2}
+
+
+async def run_suite(sessionmaker, collector: StatementCollector, repeat: int, export_repeat: int,
+                    only: set[str], random_seed: int) -> dict:
+    cases: dict[str, tuple[Callable[[], Awaitable], int]] = {}
+
+    def case(name: str, func_: Callable[[], Awaitable], times: int = repeat):
+        if not only or name.split('[')[0] in only:
+            cases[name] = (func_, times)
+
+    def with_session(func_):
+        async def run():
+            async with sessionmaker() as db:
+                await func_(db)
+
+        return run
+
+    user_id = (await pick_multi_role_users(sessionmaker, 1))[0]
+    task_ids = await pick_tasks(sessionmaker, random_seed)
+    async with sessionmaker() as db:
+        admin = await db.scalar(select(User).filter(User.admin == True))
+        heavy = await get_task_by_id(task_ids['heavy'], db)
+        typical = await get_task_by_id(task_ids['typical'], db)
+        middle_cursor = tasks_archive.encode_cursor(await db.get(Task, task_ids['middle']), Task.actual_plan_date)
+        # карточка в телеграм строится по снимку последних комментариев, собираем его заранее
+        await check_task(heavy, db)
+        await check_task(typical, db)
+        await db.commit()
+
+    case('get_user_tasks', with_session(lambda db: get_user_tasks(user_id, db)))
+    for kind in ('heavy', 'typical'):
+        task_id = task_ids[kind]
+        case(f'get_task_by_id[{kind}]', with_session(lambda db, task_id=task_id: get_task_by_id(task_id, db)))
+
+    async def task_text():
+        get_telegram_task_text(heavy, "Новая задача")
+
+    async def status_keyboards():
+        for user in typical.users:
+            generate_status_keyboard(user, typical)
+
+    case('get_telegram_task_text', task_text, repeat * MICRO_REPEAT_FACTOR)
+    case('generate_status_keyboard', status_keyboards, repeat * MICRO_REPEAT_FACTOR)
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=archive_app(sessionmaker, admin)),
+                               base_url="http://bench")
+    archive_pages = {
+        'first': {},
+        'all_by_plan_date': {'status_filter': 'all', 'sort_column': 'actual_plan_date', 'sort_order': 'asc',
+                             'after': middle_cursor, 'page': 2},
+    }
+    for kind, params in archive_pages.items():
+        async def archive_page(params=params):
+            response = await client.get('/tasks_archive', params=params)
+            assert response.status_code == 200, response.text
+
+        case(f'task_archive[{kind}]', archive_page)
+
+    export_path = Path(tempfile.gettempdir()) / f"bench_export_{os.getpid()}"
+    for fmt, writer in (('csv', write_csv), ('xlsx', write_xlsx)):
+        case(f'export_tasks_to_excel[{fmt}]', with_session(
+            lambda db, writer=writer: writer(iter_export_rows('all', 'time_updated', 'desc', db), export_path)
+        ), export_repeat)
+
+    results = {}
+    try:
+        for name, (func_, times) in cases.items():
+            # прогрев и подсчёт запросов
+            with collector.collect() as statements:
+                await func_()
+            results[name] = {**await measure(func_, times), 'queries': len(statements), 'repeat': times}
+            print(f"{name}: {results[name]}", file=sys.stderr)
+    finally:
+        await client.aclose()
+        export_path.unlink(missing_ok=True)
+    return results
+
+
+async def dataset_info(sessionmaker) -> dict:
+    async with sessionmaker() as db:
+        return {
+            'tasks': await db.scalar(select(func.count(Task.id))),
+            'comments': await db.scalar(select(func.count(Comment.id))),
+            'users': await db.scalar(select(func.count(User.id))),
+        }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    rows = []
+    regressed = False
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        row = {'name': name, 'median_ms': result['median_ms'], 'queries': result['queries']}
+        if before:
+            change = result['median_ms'] / max(before['median_ms'], 0.001) - 1
+            row.update({
+                'base_median_ms': before['median_ms'],
+                'base_queries': before['queries'],
+                'change': f"{change:+.0%}",
+            })
+            if change > threshold or result['queries'] > before['queries']:
+                row['verdict'] = "РЕГРЕССИЯ"
+                regressed = True
+        rows.append(row)
+    print(f"\n{baseline['commit']} → {current['commit']}")
+    if baseline['dataset'] != current['dataset']:
+        print(f"Внимание: разные БД замеров {baseline['dataset']} и {current['dataset']}")
+    print_table(rows, ['name', 'base_median_ms', 'median_ms', 'change', 'base_queries', 'queries', 'verdict'])
+    return not regressed
+
+
+async def main():
+    parser = base_parser("Замеры горячих путей с сохранением в JSON")
+    parser.add_argument('--tasks', type=int, default=100_000, help="Размер синтетической БД, если она пуста")
+    parser.add_argument('--export-repeat', type=int, default=3, help="Повторы выгрузки: она идёт по всей БД")
+    parser.add_argument('--only', nargs='*', default=[], help="Только перечисленные замеры, например get_user_tasks")
+    parser.add_argument('--seed', type=int, default=42, help="Зерно выбора задач для замеров")
+    parser.add_argument('--output', type=Path, help="Файл результатов, по умолчанию results/<коммит>.json")
+    parser.add_argument('--compare', type=Path, help="Результаты прошлого прогона для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Допустимый рост медианы при сравнении, доля (0.2 = 20%%)")
+    args = parser.parse_args()
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    engine = make_engine(args.url)
+    sessionmaker = make_sessionmaker(engine)
+    collector = StatementCollector(engine)
+    await create_schema(engine)
+    if not await is_seeded(engine):
+        print("Наполняем БД:", await seed(engine, tasks=args.tasks), file=sys.stderr)
+
+    report = {
+        'commit': current_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'dialect': engine.dialect.name,
+        'dataset': await dataset_info(sessionmaker),
+    }
+    with without_task_cache():
+        report['results'] = await run_suite(sessionmaker, collector, args.repeat, args.export_repeat,
+                                            set(args.only), args.seed)
+    await engine.dispose()
+
+    output = args.output or RESULTS_DIR / f"{report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"Результаты: {output}", file=sys.stderr)
+
+    if args.compare:
+        if not compare(json.loads(args.compare.read_text()), report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+"""
+Регрессионный замер get_task_by_id на "тяжёлой" задаче (по умолчанию 500 комментариев и 200 документов).
+
+    python -m benchmarks.task_detail --url sqlite+aiosqlite:///benchmarks/bench.sqlite3
+"""
+import asyncio
+import random
+import uuid
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import select, func, insert
+from sqlalchemy.orm import joinedload
+
+from benchmarks.common import base_parser, make_engine, make_sessionmaker, measure, StatementCollector, print_table
+from benchmarks.seed import create_schema, is_seeded, seed
+from database.models import Task, Comment, CommentType, Document, Statuses, UserRole, User
+from database.models.comments import CommentUserRoleAssociation
+from shared.db import get_task_by_id
+
+
+async def get_task_by_id_joined(task_id: int, db):
+    # прежняя реализация: все коллекции одним JOIN с последующим unique() и сортировкой в Python
+    query = (
+        select(Task)
+        .options(
+            joinedload(Task.task_type),
+            joinedload(Task.object),
+            joinedload(Task.comments).joinedload(Comment.user),
+            joinedload(Task.comments).joinedload(Comment.documents)
+        )
+        .filter(Task.id == task_id)
+    )
+    task = (await db.execute(query)).unique().scalar_one_or_none()
+    task.comments.sort(key=lambda x: x.time_created)
+    return task
+
+
+async def seed_heavy_task(engine, comments: int, documents: int, random_seed: int = 42) -> int:
+    rnd = random.Random(random_seed)
+    now = datetime.now()
+    async with engine.begin() as conn:
+        max_id = lambda model: conn.scalar(select(func.coalesce(func.max(model.id), 0)))
+        task_id = await max_id(Task) + 1
+        comment_start = await max_id(Comment) + 1
+        role_start = await max_id(CommentUserRoleAssociation) + 1
+        document_start = await max_id(Document) + 1
+        user_ids = (await conn.execute(select(User.id).limit(3))).scalars().all()
+
+        created = now - timedelta(days=365)
+        await conn.execute(insert(Task.__table__), [{
+            'id': task_id, 'task_type_id': 1, 'status': Statuses.ACCEPTED, 'object_id': 1,
+            'supplier_id': user_ids[0], 'supervisor_id': user_ids[1], 'executor_id': user_ids[2],
+            'initial_plan_date': date.today(), 'actual_plan_date': date.today(),
+            'description': "Долгоживущая задача с длинной историей", 'rework_count': 0,
+            'reschedule_count': 0, 'notification_count': 0, 'important': False,
+            'time_created': created, 'time_updated': now,
+        }])
+
+        comment_rows, role_rows = [], []
+        role_id = role_start
+        for n in range(comments):
+            comment_time = created + timedelta(minutes=n * 30)
+            comment_rows.append({
+                'id': comment_start + n, 'type': CommentType.comment, 'task_id': task_id,
+                'user_id': rnd.choice(user_ids), 'content': f"Комментарий {n}",
+                'time_created': comment_time, 'time_updated': comment_time,
+            })
+            for role in rnd.sample([UserRole.SUPPLIER, UserRole.EXECUTOR, UserRole.SUPERVISOR], rnd.randint(1, 3)):
+                role_rows.append({'id': role_id, 'comment_id': comment_start + n, 'author_role': role,
+                                  'time_created': comment_time, 'time_updated': comment_time})
+                role_id += 1
+        # документы кучкуются в части комментариев, как вложения пачкой
+        document_rows = [{
+            'id': document_start + n, 'uuid': str(uuid.UUID(int=rnd.getrandbits(128))), 'title': f"Документ {n}.pdf",
+            'type': "application/pdf", 'author_id': rnd.choice(user_ids),
+            'comment_id': comment_start + rnd.randrange(0, comments, 5), 'deleted': False,
+            'time_created': now, 'time_updated': now,
+        } for n in range(documents)]
+
+        await conn.execute(insert(Comment.__table__), comment_rows)
+        await conn.execute(insert(CommentUserRoleAssociation.__table__), role_rows)
+        await conn.execute(insert(Document.__table__), document_rows)
+    return task_id
+
+
+def _snapshot(task: Task) -> list:
+    return [(c.id, sorted(d.id for d in c.documents), sorted(c.author_roles)) for c in task.comments]
+
+
+async def main():
+    parser = base_parser("get_task_by_id на задаче с длинной историей")
+    parser.add_argument('--tasks', type=int, default=10_000, help="Размер синтетической БД, если она пуста")
+    parser.add_argument('--comments', type=int, default=500)
+    parser.add_argument('--documents', type=int, default=200)
+    args = parser.parse_args()
+
+    engine = make_engine(args.url)
+    sessionmaker = make_sessionmaker(engine)
+    collector = StatementCollector(engine)
+    await create_schema(engine)
+    if not await is_seeded(engine):
+        print("Наполняем БД:", await seed(engine, tasks=args.tasks))
+    task_id = await seed_heavy_task(engine, args.comments, args.documents)
+
+    rows, snapshots = [], {}
+    for name, loader in (('joined', get_task_by_id_joined), ('selectin', get_task_by_id)):
+        async with sessionmaker() as db:
+            with collector.collect() as statements:
+                snapshots[name] = _snapshot(await loader(task_id, db))
+
+        async def run():
+            async with sessionmaker() as session:
+                await loader(task_id, session)
+
+        rows.append({'loader': name, 'queries': len(statements), **await measure(run, args.repeat)})
+    assert snapshots['joined'] == snapshots['selectin'], "Загрузчики вернули разные данные"
+
+    print(f"Задача {task_id}: {args.comments} комментариев, {args.documents} документов")
+    print_table(rows, ['loader', 'queries', 'min_ms', 'median_ms', 'p95_ms'])
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
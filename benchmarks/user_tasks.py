@@ -0,0 +1,92 @@
+"""
+Сравнение get_user_tasks: три запроса по ролям против одного запроса с признаками ролей.
+
+    python -m benchmarks.user_tasks --url sqlite+aiosqlite:///benchmarks/bench.sqlite3 --users 5
+"""
+import asyncio
+
+from sqlalchemy import select, func, desc, union_all
+from sqlalchemy.orm import joinedload
+
+from benchmarks.common import base_parser, make_engine, make_sessionmaker, measure, StatementCollector, print_table
+from benchmarks.seed import create_schema, is_seeded, seed
+from database.models import Task
+from shared.db import get_user_tasks
+
+
+async def get_user_tasks_per_role(user_id: int, db):
+    # прежняя реализация: отдельный запрос на каждую роль
+    base_query = select(Task).options(
+        joinedload(Task.task_type),
+        joinedload(Task.object)
+    ).order_by(Task.actual_plan_date)
+    return {
+        "supplier_tasks": (await db.execute(
+            base_query.filter(Task.supplier_id == user_id, Task.filter_for_supplier()))).scalars().all(),
+        "supervisor_tasks": (await db.execute(
+            base_query.filter(Task.supervisor_id == user_id, Task.filter_for_supervisor()))).scalars().all(),
+        "executor_tasks": (await db.execute(
+            base_query.filter(Task.executor_id == user_id, Task.filter_for_executor()))).scalars().all(),
+    }
+
+
+async def pick_multi_role_users(sessionmaker, limit: int) -> list[int]:
+    # пользователи, у которых больше всего задач во всех ролях сразу
+    participants = union_all(
+        select(Task.supplier_id.label('user_id')).filter(Task.filter_for_supplier()),
+        select(Task.supervisor_id.label('user_id')).filter(Task.filter_for_supervisor()),
+        select(Task.executor_id.label('user_id')).filter(Task.filter_for_executor()),
+    ).subquery()
+    async with sessionmaker() as db:
+        return (await db.execute(
+            select(participants.c.user_id)
+            .group_by(participants.c.user_id)
+            .order_by(desc(func.count()))
+            .limit(limit)
+        )).scalars().all()
+
+
+def _ids(tasks: dict) -> dict:
+    return {role: sorted(task.id for task in role_tasks) for role, role_tasks in tasks.items()}
+
+
+async def main():
+    parser = base_parser("get_user_tasks: три запроса против одного")
+    parser.add_argument('--tasks', type=int, default=100_000, help="Размер синтетической БД, если она пуста")
+    parser.add_argument('--users', type=int, default=5, help="Сколько самых загруженных пользователей замерить")
+    args = parser.parse_args()
+
+    engine = make_engine(args.url)
+    sessionmaker = make_sessionmaker(engine)
+    collector = StatementCollector(engine)
+    await create_schema(engine)
+    if not await is_seeded(engine):
+        print("Наполняем БД:", await seed(engine, tasks=args.tasks))
+
+    rows = []
+    for user_id in await pick_multi_role_users(sessionmaker, args.users):
+        row = {'user_id': user_id}
+        results = {}
+        for name, func_ in (('per_role', get_user_tasks_per_role), ('single', get_user_tasks)):
+            async with sessionmaker() as db:
+                with collector.collect() as statements:
+                    results[name] = _ids(await func_(user_id, db))
+
+            async def run():
+                async with sessionmaker() as session:
+                    await func_(user_id, session)
+
+            row[f'{name}_queries'] = len(statements)
+            row[f'{name}_ms'] = (await measure(run, args.repeat))['median_ms']
+        assert results['per_role'] == results['single'], f"Расхождение в задачах пользователя {user_id}"
+        row['tasks'] = sum(len(ids) for ids in results['single'].values())
+        row['speedup'] = f"x{row['per_role_ms'] / max(row['single_ms'], 0.001):.1f}"
+        rows.append(row)
+
+    print_table(rows, ['user_id', 'tasks', 'per_role_queries', 'per_role_ms', 'single_queries', 'single_ms',
+                       'speedup'])
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1 +1,4 @@
-from .db_sessionmaker import async_dbsession, db_manager, get_db, get_db_safety
+from .db_sessionmaker import (async_dbsession, db_manager, get_db, get_db_safety, request_session_scope,
+                              get_read_db, get_read_db_safety)
+from .replicas import consistency_scope
+from .query_stats import track_queries, assert_max_queries
@@ -1,30 +1,43 @@
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from typing import AsyncGenerator, Optional
 
 from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 
-from shared.app_config import app_config
+from database.pool_telemetry import PoolTelemetry, TimedAsyncQueuePool
+from database.query_stats import instrument_engine
+from database.replicas import PrimarySession, ReplicaRouter
+from shared.app_config import app_config, DatabaseConfig
 
 
 class DatabaseSessionManager:
-    def __init__(self, echo: bool = False, expire_on_commit: bool = False):
+    def __init__(self, config: DatabaseConfig, echo: bool = False, expire_on_commit: bool = False):
         """
         Initialize the database session manager.
         """
+        self.telemetry = PoolTelemetry()
         self.engine = create_async_engine(
-            app_config.database.url,
+            config.url,
             future=True,
             echo=echo,
-            pool_size=30,
-            max_overflow=10,
-            pool_recycle=59,
+            poolclass=TimedAsyncQueuePool,
+            pool_size=config.pool_size,
+            max_overflow=config.max_overflow,
+            pool_timeout=config.pool_timeout,
+            pool_recycle=config.pool_recycle,
+            pool_pre_ping=config.pool_pre_ping,
         )
+        self.telemetry.attach(self.engine.sync_engine.pool)
+        instrument_engine(self.engine)
         self.sessionmaker = async_sessionmaker(
             bind=self.engine,
             class_=AsyncSession,
+            sync_session_class=PrimarySession,
             expire_on_commit=expire_on_commit
         )
+        self.replicas = ReplicaRouter(config)
+        self.replicas.track_writes(PrimarySession)
 
     def get_sessionmaker(self) -> async_sessionmaker[AsyncSession]:
         """
@@ -35,17 +48,55 @@ class DatabaseSessionManager:
         """
         return self.sessionmaker
 
+    def pool_stats(self) -> dict:
+        """
+        Get connection pool statistics: checkout latency, in-use and overflow connections,
+        recycle and invalidation counters.
+        """
+        return self.telemetry.stats()
+
+    def replica_stats(self) -> dict:
+        """
+        Get read replica statistics: current lag per replica, reads served by replicas
+        and reads that fell back to the primary.
+        """
+        return self.replicas.stats()
+
     async def dispose(self):
+        await self.replicas.dispose()
         await self.engine.dispose()
 
 
 # Initialize the manager
-db_manager = DatabaseSessionManager(echo=app_config.database.echo, expire_on_commit=False)
+db_manager = DatabaseSessionManager(app_config.database, echo=app_config.database.echo, expire_on_commit=False)
 
 async_dbsession: async_sessionmaker[AsyncSession] = db_manager.get_sessionmaker()
 
 
+# сессия текущего HTTP-запроса, её открывает middleware через request_session_scope
+_request_session: ContextVar[Optional[AsyncSession]] = ContextVar('request_session', default=None)
+
+
+@asynccontextmanager
+async def request_session_scope() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Одна сессия на весь запрос: её используют middleware и эндпоинты через get_db.
+    Соединение из пула берётся только при первом обращении к БД.
+    """
+    session = async_dbsession()
+    token = _request_session.set(session)
+    try:
+        yield session
+    finally:
+        _request_session.reset(token)
+        await session.close()
+
+
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    session = _request_session.get()
+    if session is not None:
+        yield session
+        return
     async with async_dbsession() as session:
         yield session
 
@@ -57,3 +108,30 @@ async def get_db_safety(existing_session: Optional[AsyncSession] = None) -> Asyn
     else:
         async with async_dbsession() as session:
             yield session
+
+
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Зависимость для эндпоинтов, которые только читают: сессия реплики, а если реплика
+    не подходит (нет, отстаёт, пользователь только что писал) - обычная сессия запроса.
+    """
+    async with db_manager.replicas.session() as session:
+        if session is not None:
+            yield session
+            return
+    async for session in get_db():
+        yield session
+
+
+@asynccontextmanager
+async def get_read_db_safety(existing_session: Optional[AsyncSession] = None) -> AsyncGenerator[AsyncSession, None]:
+    # как get_db_safety, но своя сессия по возможности открывается на реплике
+    if existing_session:
+        yield existing_session
+        return
+    async with db_manager.replicas.session() as session:
+        if session is not None:
+            yield session
+            return
+    async with async_dbsession() as session:
+        yield session
@@ -1,7 +1,8 @@
 from ._base import BaseModel
 from ._user_roles import UserRole
-from .comments import Comment, CommentType
+from .comments import Comment, CommentType, ACTIVITY_HIDDEN_TYPES
 from .documents import Document
+from .notification_outbox import OutboxMessage, OutboxStatus
 from .objects import Object
 from .organizations import Organization
 from .power_of_attorneys import PowerOfAttorney
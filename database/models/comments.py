@@ -1,7 +1,7 @@
 import enum
 from typing import List, TYPE_CHECKING
 
-from sqlalchemy import Column, Integer, Text, ForeignKey, JSON, DateTime, String, Enum
+from sqlalchemy import Column, Integer, Text, ForeignKey, JSON, DateTime, String, Enum, Index
 from sqlalchemy.orm import relationship, Mapped
 
 from ._base import BaseModel
@@ -23,6 +23,10 @@ class CommentType(enum.Enum):
     notified = "Ознакомился с задачей в телеграм"
 
 
+# служебные записи, которые не показываются в ленте задачи в телеграм
+ACTIVITY_HIDDEN_TYPES = {CommentType.error, CommentType.notified, CommentType.notify_sent}
+
+
 class CommentUserRoleAssociation(BaseModel):
     __tablename__ = 'comment_userrole_association'
     comment_id = Column(Integer, ForeignKey('comments.id'), primary_key=True)
@@ -32,6 +36,10 @@ class CommentUserRoleAssociation(BaseModel):
 
 class Comment(BaseModel):
     __tablename__ = 'comments'
+    __table_args__ = (
+        Index('ix_comments_task_time_created', 'task_id', 'time_created'),
+        Index('ft_comments_content', 'content', mysql_prefix='FULLTEXT'),
+    )
 
     type: Mapped[CommentType] = Column(Enum(CommentType), nullable=False)
     task_id: Mapped[int] = Column(Integer, ForeignKey('tasks.id'), nullable=False)
@@ -61,6 +69,22 @@ class Comment(BaseModel):
     def author_roles(self, roles: List[UserRole]):
         self.author_roles_relation = [CommentUserRoleAssociation(author_role=role) for role in roles]
 
+    def to_activity(self) -> dict:
+        return {
+            'time': self.time_updated.isoformat(),
+            'type': self.type.name,
+            'user': self.user.short_name if self.user else None,
+            'roles': [role.value for role in self.author_roles],
+            'content': self.content,
+            'previous_status': self.previous_status,
+            'new_status': self.new_status,
+            'old_date': self.old_date and self.old_date.isoformat(),
+            'new_date': self.new_date and self.new_date.isoformat(),
+            'extra_data': self.extra_data,
+            'documents': [{'uuid': doc.uuid, 'title': doc.title, 'deleted': bool(doc.deleted)}
+                          for doc in self.documents],
+        }
+
     def __init__(self, **kwargs):
         if 'author_roles' in kwargs:
             roles = kwargs.pop('author_roles')
@@ -1,7 +1,7 @@
 import uuid
 from typing import TYPE_CHECKING
 
-from sqlalchemy import Column, String, Integer, ForeignKey, Boolean
+from sqlalchemy import Column, String, Integer, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 
 from ._base import BaseModel
@@ -14,6 +14,9 @@ if TYPE_CHECKING:
 
 class Document(BaseModel):
     __tablename__ = 'documents'
+    __table_args__ = (
+        Index('ft_documents_title', 'title', mysql_prefix='FULLTEXT'),
+    )
 
     uuid: str = Column(String(36), default=lambda: str(uuid.uuid4()), unique=True, nullable=False)
     title: str = Column(String(200), nullable=False)
@@ -0,0 +1,38 @@
+import enum
+
+from sqlalchemy import Column, Integer, String, JSON, DateTime, Text, ForeignKey, Enum, Index
+from sqlalchemy.orm import Mapped
+
+from ._base import BaseModel
+
+
+class OutboxStatus(enum.Enum):
+    pending = "Ожидает отправки"
+    processing = "Отправляется"
+    failed = "Не отправлено"
+
+
+class OutboxMessage(BaseModel):
+    """
+    Уведомление в телеграм, поставленное в очередь вебприложением. Хранится до успешной отправки,
+    см. telegram_bot.utils.outbox.
+    """
+    __tablename__ = 'notification_outbox'
+    __table_args__ = (
+        # выбор следующего задания: ожидающие, у которых подошло время
+        Index('ix_notification_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+        # задания одной задачи выполняются по очереди
+        Index('ix_notification_outbox_task_status', 'task_id', 'status'),
+    )
+
+    kind: Mapped[str] = Column(String(32), nullable=False)
+    task_id: Mapped[int] = Column(Integer, ForeignKey('tasks.id'), nullable=False)
+    payload: Mapped[dict] = Column(JSON, nullable=False, default=dict)
+    status: Mapped[OutboxStatus] = Column(Enum(OutboxStatus), nullable=False, default=OutboxStatus.pending)
+    attempts: Mapped[int] = Column(Integer, nullable=False, default=0)
+    next_attempt_at: Mapped[DateTime] = Column(DateTime(timezone=True), nullable=False)
+    # до какого момента задание считается занятым обработчиком; после - его можно забрать снова
+    locked_until: Mapped[DateTime] = Column(DateTime(timezone=True), nullable=True)
+    last_error: Mapped[str] = Column(Text, nullable=True)
+    # что уже доставлено прошлыми попытками (NotificationLedger.delivered), повтор этим адресатам не шлёт
+    delivered: Mapped[list] = Column(JSON, nullable=True)
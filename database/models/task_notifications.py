@@ -1,6 +1,6 @@
 from typing import TYPE_CHECKING
 
-from sqlalchemy import Column, Integer, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 
 from ._base import BaseModel
@@ -12,6 +12,12 @@ if TYPE_CHECKING:
 
 class TaskNotification(BaseModel):
     __tablename__ = 'task_notifications'
+    __table_args__ = (
+        # get_notifications: task + user + active, сортировка по сообщению
+        Index('ix_task_notifications_task_user_active', 'task_id', 'user_id', 'active', 'telegram_message_id'),
+        # поиск задачи по ответу на сообщение
+        Index('ix_task_notifications_message_user_active', 'telegram_message_id', 'user_id', 'active'),
+    )
 
     task_id: int = Column(Integer, ForeignKey('tasks.id'), nullable=False)
     user_id: int = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -1,8 +1,8 @@
 from datetime import datetime, date
 from typing import List, TYPE_CHECKING
 
-from sqlalchemy import (Column, Integer, ForeignKey, DateTime, Text, Date,
-                        Enum as SQLAlchemyEnum, select, Boolean)
+from sqlalchemy import (Column, Integer, ForeignKey, DateTime, Text, Date, JSON,
+                        Enum as SQLAlchemyEnum, select, Boolean, Index)
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship, aliased
 
@@ -37,6 +37,24 @@ class UserChangePermissions:
 
 class Task(BaseModel):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        # списки задач пользователя по ролям (get_user_tasks)
+        Index('ix_tasks_supplier_status_plan_date', 'supplier_id', 'status', 'actual_plan_date'),
+        Index('ix_tasks_supervisor_status_plan_date', 'supervisor_id', 'status', 'actual_plan_date'),
+        Index('ix_tasks_executor_status_plan_date', 'executor_id', 'status', 'actual_plan_date'),
+        # ежедневная рассылка по срокам
+        Index('ix_tasks_status_plan_date', 'status', 'actual_plan_date'),
+        # keyset-пагинация архива по колонкам сортировки, см. webapp.endpoints.tasks_archive.SORT_COLUMNS
+        Index('ix_tasks_time_updated_id', 'time_updated', 'id'),
+        Index('ix_tasks_plan_date_id', 'actual_plan_date', 'id'),
+        Index('ix_tasks_task_type_id_id', 'task_type_id', 'id'),
+        Index('ix_tasks_object_id_id', 'object_id', 'id'),
+        Index('ix_tasks_supplier_id_id', 'supplier_id', 'id'),
+        Index('ix_tasks_supervisor_id_id', 'supervisor_id', 'id'),
+        Index('ix_tasks_executor_id_id', 'executor_id', 'id'),
+        # полнотекстовый поиск, см. shared.db.search_tasks
+        Index('ft_tasks_description', 'description', mysql_prefix='FULLTEXT'),
+    )
 
     task_type_id: int = Column(Integer, ForeignKey('task_types.id'), nullable=False)
     status = Column(SQLAlchemyEnum(Statuses), nullable=False)
@@ -52,6 +70,9 @@ class Task(BaseModel):
     reschedule_count: int = Column(Integer, default=0, nullable=False)
     notification_count: int = Column(Integer, default=0, nullable=False)
     important: bool = Column(Boolean, nullable=False, default=False)
+    # снимок последних отображаемых комментариев для карточки в телеграм (Comment.to_activity),
+    # пересобирается при записи комментариев, см. shared.db.refresh_recent_activity
+    recent_activity: list = Column(JSON, nullable=True)
 
     task_type: 'TaskType' = relationship('TaskType', lazy='joined')
     object: 'Object' = relationship('Object', back_populates='tasks', lazy='joined')
@@ -64,7 +85,7 @@ class Task(BaseModel):
                                     back_populates='tasks_as_executor', lazy='joined')
 
     comments: List['Comment'] = relationship('Comment', back_populates='task',
-                                             order_by='Comment.id')
+                                             order_by='[Comment.time_created, Comment.id]')
     notifications: List['TaskNotification'] = relationship('TaskNotification',
                                                            back_populates='task')
 
@@ -0,0 +1,128 @@
+import time
+import weakref
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+
+LATENCY_SAMPLES = 1000
+
+
+class PoolTelemetry:
+    """
+    Счётчики пула соединений: время получения соединения, занятость, переполнение,
+    пересоздание соединений по pool_recycle и инвалидации.
+    """
+
+    def __init__(self):
+        self.pool: Pool | None = None
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.overflow_checkouts = 0
+        self.max_in_use = 0
+        self.connects = 0
+        self.recycles = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._timed_checkouts = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+        self._records = weakref.WeakSet()
+        self._invalidated = weakref.WeakSet()
+
+    def attach(self, pool: Pool):
+        self.pool = pool
+        if isinstance(pool, TimedAsyncQueuePool):
+            pool.telemetry = self
+        event.listen(pool, 'connect', self._on_connect)
+        event.listen(pool, 'checkout', self._on_checkout)
+        event.listen(pool, 'invalidate', self._on_invalidate)
+        event.listen(pool, 'soft_invalidate', self._on_soft_invalidate)
+
+    def record_checkout(self, seconds: float, timed_out: bool = False):
+        if timed_out:
+            self.checkout_timeouts += 1
+            return
+        self._latencies.append(seconds)
+        self._timed_checkouts += 1
+        self._total_latency += seconds
+        self._max_latency = max(self._max_latency, seconds)
+
+    def _on_connect(self, dbapi_connection, record):
+        self.connects += 1
+        # запись пула переподключается: либо после инвалидации, либо по истечении pool_recycle
+        if record in self._records:
+            if record in self._invalidated:
+                self._invalidated.discard(record)
+            else:
+                self.recycles += 1
+        self._records.add(record)
+
+    def _on_checkout(self, dbapi_connection, record, proxy):
+        self.checkouts += 1
+        in_use = self.pool.checkedout()
+        self.max_in_use = max(self.max_in_use, in_use)
+        # выдача, пока пул работает сверх pool_size, т.е. за счёт max_overflow
+        if in_use > self.pool.size():
+            self.overflow_checkouts += 1
+
+    def _on_invalidate(self, dbapi_connection, record, exception):
+        self.invalidations += 1
+        self._invalidated.add(record)
+
+    def _on_soft_invalidate(self, dbapi_connection, record, exception):
+        self.soft_invalidations += 1
+        self._invalidated.add(record)
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        timed = len(latencies)
+        pool = self.pool
+        return {
+            'pool_size': pool.size(),
+            'in_use': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'max_in_use': self.max_in_use,
+            'checkouts': self.checkouts,
+            'overflow_checkouts': self.overflow_checkouts,
+            'checkout_timeouts': self.checkout_timeouts,
+            'checkout_ms': {
+                'avg': round(self._total_latency / self._timed_checkouts * 1000, 3) if self._timed_checkouts else 0.0,
+                'p50': round(latencies[timed // 2] * 1000, 3) if timed else 0.0,
+                'p95': round(latencies[int(timed * 0.95)] * 1000, 3) if timed else 0.0,
+                'max': round(self._max_latency * 1000, 3),
+            },
+            'connects': self.connects,
+            'recycles': self.recycles,
+            'invalidations': self.invalidations,
+            'soft_invalidations': self.soft_invalidations,
+        }
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool, замеряющий полное время выдачи соединения, включая ожидание и pre-ping."""
+
+    telemetry: PoolTelemetry | None = None
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            if self.telemetry:
+                self.telemetry.record_checkout(time.perf_counter() - start, timed_out=True)
+            raise
+        if self.telemetry:
+            self.telemetry.record_checkout(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # пул пересоздаётся при dispose/инвалидации всего пула, счётчики переходят к новому
+        pool = super().recreate()
+        if self.telemetry:
+            self.telemetry.pool = pool
+            pool.telemetry = self.telemetry
+        return pool
@@ -0,0 +1,94 @@
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+_current_stats: ContextVar[Optional['QueryStats']] = ContextVar('query_stats', default=None)
+
+
+class QueryStats:
+    """Запросы к БД, выполненные в рамках одного HTTP-запроса, апдейта бота или блока кода."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def add(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        # один и тот же текст запроса с разными параметрами - типичный признак N+1
+        return [(statement, n) for statement, n in self.statements.most_common() if n >= threshold]
+
+    def report(self, threshold: int, repeat_threshold: int):
+        suspects = self.repeated(repeat_threshold)
+        if self.count < threshold and not suspects:
+            return
+        logger.warning(f"{self.name}: {self.count} SQL statements, {self.duration * 1000:.1f} ms in DB")
+        for statement, n in suspects:
+            logger.warning(f"{self.name}: possible N+1, executed {n} times: {' '.join(statement.split())[:300]}")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_stats_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['query_stats_start'].pop()
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add(statement, time.perf_counter() - start)
+
+
+def instrument_engine(engine: Engine | AsyncEngine):
+    if isinstance(engine, AsyncEngine):
+        engine = engine.sync_engine
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+@contextmanager
+def track_queries(name: str, threshold: int = None, repeat_threshold: int = None) -> Iterator[QueryStats]:
+    """
+    Считает запросы к БД внутри блока. Если заданы пороги, по выходу пишет в лог
+    блоки с большим числом запросов и повторяющиеся запросы.
+    """
+    stats = QueryStats(name)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+        if threshold is not None:
+            stats.report(threshold, repeat_threshold or threshold)
+
+
+@contextmanager
+def assert_max_queries(limit: int, engine: Engine | AsyncEngine = None) -> Iterator[QueryStats]:
+    """
+    Для тестов: падает, если код внутри блока выполнил больше limit запросов.
+
+        with assert_max_queries(3, engine):
+            await get_task_by_id(task_id, db)
+    """
+    if engine is not None:
+        instrument_engine(engine)
+    with track_queries('assert_max_queries') as stats:
+        yield stats
+    assert stats.count <= limit, (
+            f"Expected at most {limit} SQL statements, got {stats.count}:\n" +
+            "\n".join(f"{n} x {statement}" for statement, n in stats.statements.most_common())
+    )
@@ -0,0 +1,172 @@
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncGenerator, Hashable, Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from database.query_stats import instrument_engine
+from shared.app_config import DatabaseConfig
+
+logger = logging.getLogger(__name__)
+
+# чей это запрос (telegram_id пользователя): после его записи чтение какое-то время идёт с основной БД
+_consistency_key: ContextVar[Optional[Hashable]] = ContextVar('consistency_key', default=None)
+
+
+@contextmanager
+def consistency_scope(key: Hashable) -> Iterator[None]:
+    """Помечает запрос/апдейт ключом пользователя для read-your-writes при чтении с реплик."""
+    token = _consistency_key.set(key)
+    try:
+        yield
+    finally:
+        _consistency_key.reset(token)
+
+
+class PrimarySession(Session):
+    """Сессия основной БД: отмечает, что в ней что-то записали (см. ReplicaRouter.track_writes)."""
+
+
+class ReplicaSession(Session):
+    """Сессия реплики, только чтение."""
+
+
+@event.listens_for(ReplicaSession, 'before_flush')
+def _forbid_replica_writes(session, flush_context, instances):
+    raise RuntimeError("Replica session is read-only, use get_db/get_db_safety for writes")
+
+
+class Replica:
+    def __init__(self, url: str, config: DatabaseConfig):
+        self.engine: AsyncEngine = create_async_engine(
+            url,
+            pool_size=config.pool_size,
+            max_overflow=config.max_overflow,
+            pool_timeout=config.pool_timeout,
+            pool_recycle=config.pool_recycle,
+            pool_pre_ping=config.pool_pre_ping,
+        )
+        instrument_engine(self.engine)
+        self.sessionmaker = async_sessionmaker(bind=self.engine, class_=AsyncSession,
+                                               sync_session_class=ReplicaSession, expire_on_commit=False)
+        self.host = self.engine.url.host
+        self.lag: Optional[float] = None
+        self.checked_at = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.lag is not None
+
+    async def check_lag(self):
+        self.checked_at = time.monotonic()
+        try:
+            async with self.engine.connect() as conn:
+                status = (await conn.exec_driver_sql("SHOW SLAVE STATUS")).mappings().first()
+        except DBAPIError as e:
+            logger.warning(f"Replica {self.host} is unavailable: {e}")
+            self.lag = None
+            return
+        if status is None:
+            # сервер не настроен как реплика - считаем его синхронным
+            self.lag = 0.0
+        elif status['Seconds_Behind_Master'] is None:
+            logger.warning(f"Replica {self.host}: replication is stopped")
+            self.lag = None
+        else:
+            self.lag = float(status['Seconds_Behind_Master'])
+
+
+class ReplicaRouter:
+    """
+    Выбор реплики для чтения: берётся наименее отстающая из тех, чьё отставание не больше
+    replica_max_lag. Отставание проверяется не чаще раза в replica_check_interval секунд.
+    Если реплик нет, все отстают или недоступны, либо пользователь сам писал в основную БД
+    за последние replica_max_lag секунд, читаем с основной.
+    """
+
+    def __init__(self, config: DatabaseConfig):
+        self.replicas = [Replica(url, config) for url in config.replica_urls]
+        self.max_lag = config.replica_max_lag
+        self.check_interval = config.replica_check_interval
+        self._writes: dict[Hashable, float] = {}
+        self.replica_reads = 0
+        self.primary_fallbacks = 0
+
+    def track_writes(self, session_class: type[Session]):
+        @event.listens_for(session_class, 'after_flush')
+        def after_flush(session, flush_context):
+            session.info['has_writes'] = True
+
+        @event.listens_for(session_class, 'do_orm_execute')
+        def do_orm_execute(orm_execute_state):
+            # UPDATE/INSERT через session.execute идут мимо flush
+            if not orm_execute_state.is_select:
+                orm_execute_state.session.info['has_writes'] = True
+
+        @event.listens_for(session_class, 'after_commit')
+        def after_commit(session):
+            if session.info.pop('has_writes', False):
+                self.note_write(_consistency_key.get())
+
+        @event.listens_for(session_class, 'after_rollback')
+        def after_rollback(session):
+            session.info.pop('has_writes', None)
+
+    def note_write(self, key: Optional[Hashable]):
+        if key is None or not self.replicas:
+            return
+        now = time.monotonic()
+        self._writes[key] = now
+        # старые отметки больше не влияют на выбор, не копим их
+        if len(self._writes) > 1000:
+            self._writes = {k: t for k, t in self._writes.items() if now - t < self.max_lag}
+
+    def wrote_recently(self, key: Optional[Hashable]) -> bool:
+        return key is not None and time.monotonic() - self._writes.get(key, 0) < self.max_lag
+
+    async def pick(self) -> Optional[Replica]:
+        if not self.replicas or self.wrote_recently(_consistency_key.get()):
+            return None
+        now = time.monotonic()
+        for replica in self.replicas:
+            if now - replica.checked_at > self.check_interval:
+                await replica.check_lag()
+        fresh = [r for r in self.replicas if r.healthy and r.lag <= self.max_lag]
+        return min(fresh, key=lambda r: r.lag) if fresh else None
+
+    @asynccontextmanager
+    async def session(self) -> AsyncGenerator[Optional[AsyncSession], None]:
+        """Сессия реплики или None, если читать нужно с основной БД."""
+        replica = await self.pick()
+        if replica is None:
+            if self.replicas:
+                self.primary_fallbacks += 1
+            yield None
+            return
+        async with replica.sessionmaker() as session:
+            try:
+                await session.connection()
+            except DBAPIError as e:
+                logger.warning(f"Replica {replica.host} is unavailable: {e}")
+                replica.lag = None
+                self.primary_fallbacks += 1
+                yield None
+                return
+            self.replica_reads += 1
+            yield session
+
+    def stats(self) -> dict:
+        return {
+            'replicas': {r.host: r.lag for r in self.replicas},
+            'replica_reads': self.replica_reads,
+            'primary_fallbacks': self.primary_fallbacks,
+        }
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
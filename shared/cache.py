@@ -0,0 +1,249 @@
+import asyncio
+import enum
+import hashlib
+import json
+import logging
+import time
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Hashable
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+from sqlalchemy import DateTime, Date, Enum, inspect
+
+from database.models import Comment, Document
+from database.models.comments import CommentUserRoleAssociation
+from shared.app_config import app_config
+
+TASK_CACHE_KEY = "task_cache"
+TASK_CACHE_TTL = 600
+REFERENCE_CACHE_TTL = 300
+USER_CACHE_TTL = 60
+
+_MISSING = object()
+
+# снимок сохраняется, только если поколение задачи не изменилось с момента чтения (см. TaskCache)
+SET_IF_GENERATION = """
+if (redis.call('get', KEYS[2]) or '') == ARGV[1] then
+    return redis.call('set', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+return false
+"""
+
+redis_cache = redis.Redis(
+    host=app_config.redis.host,
+    port=app_config.redis.port,
+    db=app_config.redis.db,
+    password=app_config.redis.password
+)
+
+
+def _encode(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.name
+    return value
+
+
+def _decode(column_type, value):
+    if value is None:
+        return None
+    if isinstance(column_type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column_type, Date):
+        return date.fromisoformat(value)
+    if isinstance(column_type, Enum) and column_type.enum_class is not None:
+        return column_type.enum_class[value]
+    return value
+
+
+def dump_row(obj) -> dict:
+    return {attr.key: _encode(getattr(obj, attr.key)) for attr in inspect(obj).mapper.column_attrs}
+
+
+def load_row(model, data: dict) -> dict:
+    # колонки, которых нет в снимке, дают KeyError: такой снимок считается промахом
+    return {attr.key: _decode(attr.columns[0].type, data[attr.key]) for attr in inspect(model).column_attrs}
+
+
+def snapshot_schema(*models) -> str:
+    # метка схемы в ключе: после изменения колонок снимки прошлой версии не читаются
+    columns = [f"{column.table.name}.{column.name}:{column.type!r}" for model in models
+               for column in model.__table__.columns]
+    return hashlib.sha1("|".join(columns).encode()).hexdigest()[:8]
+
+
+class TaskCache:
+    """
+    Лента комментариев задачи (комментарии, роли авторов, документы) в Redis, в JSON, без пользователей:
+    их и саму задачу get_task_by_id берёт из БД. Снимок хранится вместе с версией, которую вызывающий
+    берёт из БД; не совпала - промах. Битый или устаревший по схеме снимок тоже промах, ключ удаляется.
+
+    invalidate удаляет снимок и увеличивает поколение задачи. set сохраняет снимок, только если
+    поколение не изменилось с get: загрузка, начатая до записи, свой результат в кэш не кладёт.
+    """
+
+    def __init__(self, client: redis.Redis, schema: str, ttl: int = TASK_CACHE_TTL):
+        self.client = client
+        self.schema = schema
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._set_if_generation = client.register_script(SET_IF_GENERATION)
+
+    def _key(self, task_id: int) -> str:
+        return f"{TASK_CACHE_KEY}:{self.schema}:{task_id}"
+
+    @staticmethod
+    def _generation_key(task_id: int) -> str:
+        return f"{TASK_CACHE_KEY}:generation:{task_id}"
+
+    async def get(self, task_id: int, version: str) -> tuple[list[dict] | None, str]:
+        """Возвращает ленту (или None) и поколение, которое нужно передать в set."""
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.get(self._key(task_id))
+                pipe.get(self._generation_key(task_id))
+                raw, generation = await pipe.execute()
+        except RedisError as e:
+            logging.warning(f"Task cache unavailable: {e}")
+            raw, generation = None, None
+        generation = generation.decode() if generation else ""
+        if raw:
+            try:
+                snapshot = json.loads(raw)
+                if snapshot['version'] == version:
+                    comments = self._load_comments(snapshot['comments'])
+                    self.hits += 1
+                    return comments, generation
+            except (ValueError, KeyError, TypeError) as e:
+                logging.warning(f"Task cache entry for {task_id} is unreadable, dropping it: {e!r}")
+                await self._delete(self._key(task_id))
+        self.misses += 1
+        return None, generation
+
+    async def set(self, task_id: int, version: str, comments: list, generation: str):
+        snapshot = {'version': version, 'comments': [self._dump_comment(comment) for comment in comments]}
+        try:
+            await self._set_if_generation(keys=[self._key(task_id), self._generation_key(task_id)],
+                                          args=[generation, json.dumps(snapshot), self.ttl])
+        except RedisError as e:
+            logging.warning(f"Task cache unavailable: {e}")
+
+    async def invalidate(self, *task_ids: int):
+        if not task_ids:
+            return
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.delete(*(self._key(task_id) for task_id in task_ids))
+                for task_id in task_ids:
+                    # поколение живёт дольше любой загрузки, потом отсутствие ключа тоже даёт промах в set
+                    pipe.incr(self._generation_key(task_id))
+                    pipe.expire(self._generation_key(task_id), self.ttl)
+                await pipe.execute()
+        except RedisError as e:
+            logging.warning(f"Task cache invalidation failed for {task_ids}: {e}")
+
+    async def _delete(self, key: str):
+        try:
+            await self.client.delete(key)
+        except RedisError as e:
+            logging.warning(f"Task cache unavailable: {e}")
+
+    @staticmethod
+    def _dump_comment(comment: Comment) -> dict:
+        return {
+            'row': dump_row(comment),
+            'roles': [dump_row(role) for role in comment.author_roles_relation],
+            'documents': [dump_row(document) for document in comment.documents],
+        }
+
+    @staticmethod
+    def _load_comments(data: list[dict]) -> list[dict]:
+        return [{
+            'row': load_row(Comment, item['row']),
+            'roles': [load_row(CommentUserRoleAssociation, role) for role in item['roles']],
+            'documents': [load_row(Document, document) for document in item['documents']],
+        } for item in data]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0
+        }
+
+
+task_cache = TaskCache(redis_cache, snapshot_schema(Comment, CommentUserRoleAssociation, Document))
+
+
+class TTLCache:
+    """
+    Кэш в памяти процесса с ограниченным временем жизни записей.
+
+    Загрузка, начатая до invalidate/clear, свой результат в кэш не кладёт - иначе
+    после изменения справочника в кэш могли бы вернуться устаревшие данные.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: dict[Hashable, tuple[float, Any]] = {}
+        self._generations: dict[Hashable, int] = {}
+        self._locks: dict[Hashable, asyncio.Lock] = {}
+
+    def get(self, key: Hashable, default=None):
+        entry = self._data.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        self._data.pop(key, None)
+        return default
+
+    def set(self, key: Hashable, value, generation: int = None):
+        if generation is not None and generation != self._generations.get(key, 0):
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        # одновременные промахи по одному ключу ждут одну загрузку
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+            generation = self._generations.get(key, 0)
+            value = await loader()
+            self.set(key, value, generation)
+            return value
+
+    def invalidate(self, *keys: Hashable):
+        for key in keys:
+            self._data.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self):
+        self.invalidate(*set(self._data) | set(self._generations))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'hit_rate': round(self.hits / total, 3) if total else 0.0
+        }
+
+# справочники для форм задач: типы задач, объекты, активные пользователи
+reference_cache = TTLCache(REFERENCE_CACHE_TTL)
+
+# пользователи по telegram_id для проверки доступа в middleware бота и веба;
+# короткий TTL ограничивает расхождение, если бот и веб запущены разными процессами
+user_cache = TTLCache(USER_CACHE_TTL)
@@ -1,14 +1,33 @@
-from datetime import date, datetime
+import re
+from datetime import date, timedelta
 from typing import Dict, Sequence
 from typing import Optional
 
-from sqlalchemy import and_
-from sqlalchemy import select
+from sqlalchemy import and_, or_
+from sqlalchemy import select, update, union_all, func, inspect
+from sqlalchemy.dialects.mysql import match
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload, joinedload
-
-from database import get_db_safety
-from database.models import Task, Comment, TaskType, Object, User, CommentType, TaskNotification, Statuses
+from sqlalchemy.orm import selectinload, joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from database import get_db_safety, get_read_db_safety
+from database.models import (Task, Comment, TaskType, Object, User, CommentType, TaskNotification, Statuses,
+                             Document, NOTIFICATION_STATUSES, ACTIVITY_HIDDEN_TYPES)
+from database.models.comments import CommentUserRoleAssociation
+from shared.cache import task_cache, reference_cache, user_cache
+
+# в карточке задачи последние RECENT_ACTIVITY_SIZE записей, и хотя бы один обычный комментарий,
+# если он найдётся среди последних RECENT_ACTIVITY_LIMIT записей
+RECENT_ACTIVITY_SIZE = 5
+RECENT_ACTIVITY_LIMIT = 20
+# комментариев на странице задачи при открытии и на каждую догрузку
+COMMENTS_PAGE_SIZE = 30
+# полнотекстовый поиск: слова короче innodb_ft_min_token_size в индекс не попадают
+SEARCH_MIN_TERM_SIZE = 3
+SEARCH_PAGE_SIZE = 20
+# дальше этого числа результатов не листаем: каждая страница сортирует все совпадения до OFFSET
+SEARCH_MAX_RESULTS = 200
 
 
 async def get_user_by_tg(telegram_id: int, db: AsyncSession = None):
@@ -17,51 +36,221 @@ async def get_user_by_tg(telegram_id: int, db: AsyncSession = None):
         return result.scalars().first()
 
 
+async def get_cached_user_by_tg(telegram_id: int) -> User | None:
+    # отсоединённый объект, общий для всех запросов: для изменений его нужно merge в свою сессию
+    return await user_cache.get_or_load(telegram_id, lambda: get_user_by_tg(telegram_id))
+
+
+def _attach(db: AsyncSession, model, row: dict):
+    # строка из снимка как сохранённый объект сессии, без запроса; уже загруженный объект не перетираем
+    mapper = inspect(model)
+    key = mapper.identity_key_from_primary_key([row[column.key] for column in mapper.primary_key])
+    if (current := db.identity_map.get(key)) is not None:
+        return current
+    obj = mapper.class_manager.new_instance()
+    for name, value in row.items():
+        set_committed_value(obj, name, value)
+    make_transient_to_detached(obj)
+    db.add(obj)
+    return obj
+
+
+async def _restore_comments(task: Task, comments: list[dict], db: AsyncSession) -> Task:
+    # авторов снимок не хранит: тех, кого ещё нет в сессии, догружаем одним запросом
+    user_ids = {item['row']['user_id'] for item in comments} - {None}
+    if missing := [user_id for user_id in user_ids if identity_key(User, user_id) not in db.identity_map]:
+        await db.execute(select(User).filter(User.id.in_(missing)))
+
+    restored = []
+    for item in comments:
+        comment = _attach(db, Comment, item['row'])
+        loaded = comment.__dict__
+        if 'author_roles_relation' not in loaded:
+            set_committed_value(comment, 'author_roles_relation',
+                                [_attach(db, CommentUserRoleAssociation, row) for row in item['roles']])
+        if 'documents' not in loaded:
+            set_committed_value(comment, 'documents', [_attach(db, Document, row) for row in item['documents']])
+        if 'user' not in loaded:
+            user = db.identity_map.get(identity_key(User, comment.user_id)) if comment.user_id else None
+            set_committed_value(comment, 'user', user)
+        restored.append(comment)
+    set_committed_value(task, 'comments', restored)
+    return task
+
+
 async def get_task_by_id(task_id: int, db: AsyncSession = None) -> Task | None:
     async with get_db_safety(db) as db:
+        # версия ленты: время изменения задачи и последний комментарий - новые комментарии задачу не меняют
+        last_comment_id = (select(func.max(Comment.id))
+                           .filter(Comment.task_id == Task.id)
+                           .correlate(Task)
+                           .scalar_subquery())
+        row = (await db.execute(
+            select(Task, Task.time_updated, last_comment_id).filter(Task.id == task_id)
+        )).first()
+        if row is None:
+            return None
+        task, time_updated, last_comment_id = row
+        version = f"{time_updated.isoformat()}|{last_comment_id}"
+
+        # задачу с несохранёнными изменениями снимком не дополняем
+        comments, generation = await task_cache.get(task_id, version)
+        if comments is not None and not db.is_modified(task) and 'comments' not in task.__dict__:
+            return await _restore_comments(task, comments, db)
+
+        # коллекции грузятся отдельными запросами (selectin), чтобы не перемножать
+        # комментарии × документы × роли; порядок комментариев задаёт relationship
         query = (
             select(Task)
             .options(
                 joinedload(Task.task_type),
                 joinedload(Task.object),
-                joinedload(Task.comments).joinedload(Comment.user),
-                joinedload(Task.comments).joinedload(Comment.documents)
+                selectinload(Task.comments).options(
+                    joinedload(Comment.user),
+                    selectinload(Comment.documents),
+                    selectinload(Comment.author_roles_relation)
+                )
             )
             .filter(Task.id == task_id)
         )
 
         result = await db.execute(query)
-        task = result.unique().scalar_one_or_none()
-        task.comments.sort(key=lambda x: x.time_created)
+        task = result.scalar_one_or_none()
+        if task:
+            # снимок кладётся, только если с момента чтения задачу никто не менял (см. TaskCache)
+            await task_cache.set(task_id, version, task.comments, generation)
         return task
 
 
+async def get_task_comments_page(task_id: int, before: int = None, limit: int = COMMENTS_PAGE_SIZE,
+                                 db: AsyncSession = None) -> tuple[Sequence[Comment], int | None]:
+    """
+    Страница ленты комментариев задачи, от новых к старым. before - id последнего показанного
+    комментария (курсор), возвращает комментарии и курсор следующей страницы или None.
+    """
+    async with get_read_db_safety(db) as db:
+        query = (
+            select(Comment)
+            .options(joinedload(Comment.user), selectinload(Comment.documents))
+            .filter(Comment.task_id == task_id)
+            .order_by(Comment.time_created.desc(), Comment.id.desc())
+            .limit(limit + 1)
+        )
+        if before is not None:
+            # keyset по (time_created, id) идёт по индексу ix_comments_task_time_created без OFFSET
+            cursor = (select(Comment.time_created)
+                      .filter(Comment.id == before, Comment.task_id == task_id)
+                      .scalar_subquery())
+            query = query.filter(or_(
+                Comment.time_created < cursor,
+                and_(Comment.time_created == cursor, Comment.id < before)
+            ))
+        comments = (await db.execute(query)).unique().scalars().all()
+        if len(comments) > limit:
+            comments = comments[:limit]
+            return comments, comments[-1].id
+        return comments, None
+
+
+def search_max_page(page_size: int = SEARCH_PAGE_SIZE) -> int:
+    return max(SEARCH_MAX_RESULTS // page_size, 1)
+
+
+def fulltext_terms(text: str) -> str | None:
+    # булев режим: все слова обязательны, каждое ищется по началу (падежи, "задач*")
+    terms = [term for term in re.findall(r'\w+', text) if len(term) >= SEARCH_MIN_TERM_SIZE]
+    return ' '.join(f'+{term}*' for term in terms) or None
+
+
+async def search_tasks(text: str, page: int = 1, page_size: int = SEARCH_PAGE_SIZE,
+                       db: AsyncSession = None) -> tuple[list[tuple[Task, float]], bool]:
+    """
+    Поиск задач по описанию, комментариям и названиям документов через FULLTEXT-индексы MariaDB.
+    Релевантность задачи - сумма релевантности всех совпадений. Возвращает (задача, оценка)
+    для страницы и признак следующей страницы. Листать можно до SEARCH_MAX_RESULTS результатов,
+    страницы дальше приводятся к последней допустимой.
+    """
+    terms = fulltext_terms(text)
+    if not terms:
+        return [], False
+    max_page = search_max_page(page_size)
+    page = min(max(page, 1), max_page)
+    async with get_read_db_safety(db) as db:
+        in_description = match(Task.description, against=terms).in_boolean_mode()
+        in_comment = match(Comment.content, against=terms).in_boolean_mode()
+        in_document = match(Document.title, against=terms).in_boolean_mode()
+        hits = union_all(
+            select(Task.id.label('task_id'), in_description.label('score')).filter(in_description),
+            select(Comment.task_id, in_comment).filter(in_comment, Comment.type != CommentType.error),
+            select(Comment.task_id, in_document).select_from(Document)
+            .join(Comment, Comment.id == Document.comment_id).filter(in_document)
+        ).subquery()
+        score = func.sum(hits.c.score).label('score')
+        ranked = (
+            select(hits.c.task_id, score)
+            .group_by(hits.c.task_id)
+            .order_by(score.desc(), hits.c.task_id.desc())
+            .offset((page - 1) * page_size)
+            .limit(page_size + 1)
+            .subquery()
+        )
+        query = (
+            select(Task, ranked.c.score)
+            .join(ranked, Task.id == ranked.c.task_id)
+            .options(joinedload(Task.task_type), joinedload(Task.object))
+            .order_by(ranked.c.score.desc(), Task.id.desc())
+        )
+        results = [(task, score) for task, score in await db.execute(query)]
+        return results[:page_size], len(results) > page_size and page < max_page
+
+
+async def _load_reference(query):
+    # справочники грузятся в отдельной сессии, чтобы закэшированные объекты
+    # не были привязаны к сессии запроса и не пересекались с её identity map
+    async with get_db_safety() as db:
+        return (await db.execute(query)).scalars().all()
+
+
+async def get_active_users() -> Sequence[User]:
+    return await reference_cache.get_or_load('users', lambda: _load_reference(
+        select(User).filter(User.active == True).order_by(User.last_name)))
+
+
 async def get_task_edit_common_data(db: AsyncSession = None):
-    async with get_db_safety(db) as db:
-        task_types = (await db.execute(select(TaskType).filter(TaskType.active == True))).scalars().all()
-        objects = (await db.execute(select(Object).filter(Object.active == True))).scalars().all()
-        users = (await db.execute(select(User).filter(User.active == True).order_by(User.last_name))).scalars().all()
-        return {"task_types": task_types, "objects": objects, "users": users}
+    task_types = await reference_cache.get_or_load('task_types', lambda: _load_reference(
+        select(TaskType).filter(TaskType.active == True)))
+    objects = await reference_cache.get_or_load('objects', lambda: _load_reference(
+        select(Object).filter(Object.active == True)))
+    users = await get_active_users()
+    return {"task_types": task_types, "objects": objects, "users": users}
 
 
 async def get_user_tasks(user_id: int, db: AsyncSession = None) -> Dict[str, Sequence[Task]]:
-    async with get_db_safety(db) as db:
-        base_query = select(Task).options(
+    async with get_read_db_safety(db) as db:
+        # одна выборка на все роли: каждая задача приходит один раз с признаками ролей
+        is_supplier = and_(Task.supplier_id == user_id, Task.filter_for_supplier())
+        is_supervisor = and_(Task.supervisor_id == user_id, Task.filter_for_supervisor())
+        is_executor = and_(Task.executor_id == user_id, Task.filter_for_executor())
+        query = select(
+            Task,
+            is_supplier.label('is_supplier'),
+            is_supervisor.label('is_supervisor'),
+            is_executor.label('is_executor')
+        ).options(
             joinedload(Task.task_type),
             joinedload(Task.object)
+        ).filter(
+            or_(is_supplier, is_supervisor, is_executor)
         ).order_by(Task.actual_plan_date)
 
-        supplier_tasks = (await db.execute(
-            base_query.filter(Task.supplier_id == user_id, Task.filter_for_supplier())
-        )).scalars().all()
-
-        supervisor_tasks = (await db.execute(
-            base_query.filter(Task.supervisor_id == user_id, Task.filter_for_supervisor())
-        )).scalars().all()
-
-        executor_tasks = (await db.execute(
-            base_query.filter(Task.executor_id == user_id, Task.filter_for_executor())
-        )).scalars().all()
+        supplier_tasks, supervisor_tasks, executor_tasks = [], [], []
+        for task, supplier, supervisor, executor in await db.execute(query):
+            if supplier:
+                supplier_tasks.append(task)
+            if supervisor:
+                supervisor_tasks.append(task)
+            if executor:
+                executor_tasks.append(task)
 
         return {
             "supplier_tasks": supplier_tasks,
@@ -70,11 +259,46 @@ async def get_user_tasks(user_id: int, db: AsyncSession = None) -> Dict[str, Seq
         }
 
 
+async def refresh_recent_activity(task_id: int, db: AsyncSession) -> list[dict]:
+    """
+    Пересобирает снимок последних комментариев задачи (Task.recent_activity) в текущей транзакции,
+    коммит остаётся за вызывающим. Несохранённые комментарии попадают в выборку через autoflush.
+    """
+    query = (
+        select(Comment)
+        .options(joinedload(Comment.user), selectinload(Comment.documents))
+        .filter(Comment.task_id == task_id, Comment.type.not_in(ACTIVITY_HIDDEN_TYPES))
+        .order_by(Comment.time_created.desc(), Comment.id.desc())
+        .limit(RECENT_ACTIVITY_LIMIT)
+        # только что добавленные комментарии уже в сессии без пользователя и документов
+        .execution_options(populate_existing=True)
+    )
+    activity = []
+    has_comment = False
+    for comment in (await db.execute(query)).unique().scalars():
+        has_comment = has_comment or comment.type == CommentType.comment
+        activity.append(comment.to_activity())
+        if len(activity) >= RECENT_ACTIVITY_SIZE and has_comment:
+            break
+    activity.reverse()
+    # снимок - производные данные, время изменения задачи не трогаем
+    await db.execute(
+        update(Task)
+        .where(Task.id == task_id)
+        .values(recent_activity=activity, time_updated=Task.time_updated)
+        .execution_options(synchronize_session=False)
+    )
+    if task := db.identity_map.get(identity_key(Task, task_id)):
+        set_committed_value(task, 'recent_activity', activity)
+    return activity
+
+
 async def add_error(tid: int, err: str, uid: int = None, db: AsyncSession = None) -> Comment:
     async with get_db_safety(db) as db:
         erc = Comment(type=CommentType.error, task_id=tid, user_id=uid, content=err)
         db.add(erc)
         await db.commit()
+        await task_cache.invalidate(tid)
         return erc
 
 
@@ -88,19 +312,10 @@ async def add_comment(task: Task, user: User, comment: str = None, db: AsyncSess
             content=comment
         )
         db.add(new_comment)
+        if new_comment.type not in ACTIVITY_HIDDEN_TYPES:
+            await refresh_recent_activity(task.id, db)
         await db.commit()
-        return new_comment
-
-
-async def notify_sent(task: Task, user: User, db: AsyncSession = None) -> Comment:
-    async with get_db_safety(db) as db:
-        new_comment = Comment(
-            type=CommentType.notify_sent,
-            task_id=task.id,
-            user_id=user.id,
-            author_roles=list(task.get_user_roles(user.id))
-        )
-        db.add(new_comment)
+        await task_cache.invalidate(task.id)
         return new_comment
 
 
@@ -126,7 +341,9 @@ async def date_change(task: Task, user: User,
             content=comment or ""
         )
         db.add(new_comment)
+        await refresh_recent_activity(task.id, db)
         await db.commit()
+        await task_cache.invalidate(task.id)
         await db.refresh(task)
         return new_comment
 
@@ -156,7 +373,9 @@ async def status_change(task: Task, user: User,
             new_status=new_status.name
         )
         db.add(new_comment)
+        await refresh_recent_activity(task.id, db)
         await db.commit()
+        await task_cache.invalidate(task.id)
         await db.refresh(task)
         return new_comment
 
@@ -186,6 +405,36 @@ async def get_notifications(
         return notifications
 
 
+async def get_notification_by_message(
+        telegram_message_id: int,
+        user_id: int,
+        db: AsyncSession = None
+) -> TaskNotification | None:
+    async with get_db_safety(db) as db:
+        query = select(TaskNotification).filter_by(
+            telegram_message_id=telegram_message_id,
+            user_id=user_id,
+            active=True
+        )
+        return (await db.execute(query)).scalar_one_or_none()
+
+
+def get_deadline_tasks_query(now: date):
+    tomorrow = now + timedelta(days=1)
+    date_ranges = [(now + timedelta(days=x)) for x in [3, 7]]
+
+    # карточке хватает Task.recent_activity, историю комментариев не грузим
+    return select(Task).filter(
+        and_(
+            or_(
+                Task.actual_plan_date.in_(date_ranges),
+                Task.actual_plan_date <= tomorrow
+            ),
+            Task.status.in_(NOTIFICATION_STATUSES)
+        )
+    ).order_by(Task.actual_plan_date)
+
+
 async def get_notified_users(
         task_id: int,
         db: AsyncSession = None
@@ -205,20 +454,3 @@ async def get_notified_users(
         )
         result = await db.execute(query)
         return result.scalars().all()
-
-
-async def add_notification(task: Task, user_id: int, message_id: int,
-                           db: AsyncSession = None):
-    async with get_db_safety(db) as db:
-        task = await db.merge(task)
-        new_notification = TaskNotification(
-            task_id=task.id,
-            user_id=user_id,
-            telegram_message_id=message_id,
-            active=True
-        )
-        db.add(new_notification)
-        task.notification_count += 1
-        task.last_notification_date = datetime.now()
-        await db.commit()
-        await db.refresh(task)
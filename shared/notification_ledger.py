@@ -0,0 +1,139 @@
+import logging
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncGenerator, Iterable, Optional
+
+from sqlalchemy import insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Task, Comment, CommentType, TaskNotification, User
+from shared.cache import task_cache
+
+logger = logging.getLogger(__name__)
+
+
+def card_key(task_id: int, user_id: int) -> str:
+    return f"card:{task_id}:{user_id}"
+
+
+class NotificationLedger:
+    """
+    Учёт одной логической рассылки: отправленные и снятые сообщения, отметки о напоминаниях и ошибки
+    копятся и записываются одной транзакцией в flush. Счётчики задач увеличиваются
+    в самом UPDATE, поэтому параллельные рассылки по одной задаче не теряют инкременты.
+
+    С retry_transient=True временные сбои отправки (429, сеть, 5xx) не пишутся ошибкой в задачу,
+    а копятся в postponed: рассылку повторит очередь уведомлений (telegram_bot.utils.outbox).
+    Ключи доставленных сообщений копятся в delivered; повтор передаёт их обратно, и was_delivered
+    позволяет не слать второй раз то, что ушло до сбоя.
+    """
+
+    def __init__(self, retry_transient: bool = False, delivered: Iterable[str] = ()):
+        self._sent: list[dict] = []
+        self._deactivated: list[TaskNotification] = []
+        self._comments: list[Comment] = []
+        self._tasks: set[int] = set()
+        self.retry_transient = retry_transient
+        self.postponed: list[str] = []
+        self.retry_after = 0
+        self._previously_delivered = frozenset(delivered)
+        self.delivered: set[str] = set(delivered)
+
+    def __bool__(self):
+        return bool(self._sent or self._deactivated or self._comments)
+
+    @property
+    def sent_count(self) -> int:
+        return len(self._sent)
+
+    @property
+    def error_count(self) -> int:
+        return sum(comment.type == CommentType.error for comment in self._comments)
+
+    def was_delivered(self, key: str) -> bool:
+        return key in self._previously_delivered
+
+    def mark_delivered(self, key: str):
+        self.delivered.add(key)
+
+    def sent(self, task_id: int, user_id: int, message_id: int):
+        self._sent.append({'task_id': task_id, 'user_id': user_id, 'telegram_message_id': message_id,
+                           'active': True})
+        self._tasks.add(task_id)
+        self.mark_delivered(card_key(task_id, user_id))
+
+    def deactivated(self, notification: TaskNotification):
+        # меняем сам объект: autoflush покажет снятие последующим запросам в этой же транзакции
+        notification.active = False
+        self._deactivated.append(notification)
+
+    def reminder_sent(self, task: Task, user: User):
+        self._comments.append(Comment(
+            type=CommentType.notify_sent,
+            task_id=task.id,
+            user_id=user.id,
+            author_roles=list(task.get_user_roles(user.id))
+        ))
+        self._tasks.add(task.id)
+
+    def error(self, task_id: int, err: str, user_id: int = None):
+        self._comments.append(Comment(type=CommentType.error, task_id=task_id, user_id=user_id, content=err))
+        self._tasks.add(task_id)
+
+    def postpone(self, err: str, retry_after: int = 0):
+        self.postponed.append(err)
+        self.retry_after = max(self.retry_after, retry_after)
+
+    async def flush(self, db: AsyncSession):
+        if not self:
+            return
+        if self._sent:
+            await db.execute(insert(TaskNotification), self._sent)
+            now = datetime.now()
+            for task_id, count in Counter(row['task_id'] for row in self._sent).items():
+                await db.execute(
+                    update(Task)
+                    .where(Task.id == task_id)
+                    .values(notification_count=Task.notification_count + count, last_notification_date=now)
+                )
+        for notification in self._deactivated:
+            # после отката в flush_after_error снятие нужно выставить заново
+            notification.active = False
+        db.add_all(self._comments)
+        await db.commit()
+        await task_cache.invalidate(*self._tasks)
+        self._sent, self._deactivated, self._comments, self._tasks = [], [], [], set()
+
+    async def flush_after_error(self, db: AsyncSession):
+        """
+        Сохраняет накопленное, когда рассылка прервалась исключением: доставленные сообщения
+        должны попасть в TaskNotification, иначе их не отредактировать и повтор пришлёт дубли.
+        Если транзакция сессии уже сломана, откатывает её и пишет журнал заново. Собственные
+        ошибки только логирует, чтобы наружу ушло исходное исключение.
+        """
+        try:
+            await self.flush(db)
+        except Exception:
+            try:
+                await db.rollback()
+                await self.flush(db)
+            except Exception:
+                logger.exception("Не удалось сохранить журнал уведомлений после ошибки рассылки")
+
+
+@asynccontextmanager
+async def notification_ledger(db: AsyncSession,
+                              existing_ledger: Optional[NotificationLedger] = None
+                              ) -> AsyncGenerator[NotificationLedger, None]:
+    # вложенные вызовы пишут в общий журнал, сохраняет его тот, кто создал
+    if existing_ledger is not None:
+        yield existing_ledger
+    else:
+        ledger = NotificationLedger()
+        try:
+            yield ledger
+        except BaseException:
+            await ledger.flush_after_error(db)
+            raise
+        await ledger.flush(db)
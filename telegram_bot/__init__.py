@@ -2,21 +2,26 @@ import asyncio
 import importlib
 import logging
 import pkgutil
+from functools import partial
 from pathlib import Path
 
 import aiocron
 from aiogram import Dispatcher, Bot, types
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.redis import RedisStorage
 from aiogram.types import BotCommand
 
 from shared.app_config import app_config
 from telegram_bot.bot import bot
-from telegram_bot.middlewares import UserAndDBSessionCheckMiddleware
+from telegram_bot.middlewares import UserAndDBSessionCheckMiddleware, QueryStatsMiddleware
 from telegram_bot.utils.notifications import notify_everyday_tasks_deadlines, send_notify
+from telegram_bot.utils.outbox import OutboxWorker
 
 logging.basicConfig(level=logging.getLevelName(app_config.log_level.upper()))
 logger = logging.getLogger(__name__)
 
+OUTBOX_RESTART_DELAY = 5  # секунды между падением обработчика очереди уведомлений и перезапуском
+
 
 async def register_routers(dp: Dispatcher, bot: Bot):
     commands = {}
@@ -38,10 +43,11 @@ async def register_routers(dp: Dispatcher, bot: Bot):
     await bot.set_my_commands([BotCommand(command=f"/{c}", description=d) for c, d in commands.items()])
 
 
-async def start_bot():
-    storage = RedisStorage.from_url(app_config.redis.url)
+async def setup_dispatcher(storage: BaseStorage) -> Dispatcher:
+    # вся настройка обработки апдейтов; её же использует нагрузочный стенд (benchmarks.bot_load)
     dp = Dispatcher(storage=storage)
 
+    dp.update.outer_middleware(QueryStatsMiddleware())
     dp.update.middleware(UserAndDBSessionCheckMiddleware())
     await register_routers(dp, bot)
 
@@ -50,7 +56,28 @@ async def start_bot():
         logger.error(f"Update: {event.update} \n{event.exception}", exc_info=True)
         return True
 
+    return dp
+
+
+def start_outbox(worker: OutboxWorker):
+    # задачу никто не ждёт, поэтому падение логируется и обработчик перезапускается, иначе очередь встанет молча.
+    # Ссылку на задачу держит worker.task: цикл событий хранит задачи только по слабым ссылкам
+    worker.task = asyncio.create_task(worker.run())
+    worker.task.add_done_callback(partial(_restart_outbox, worker))
+
+
+def _restart_outbox(worker: OutboxWorker, task: asyncio.Task):
+    if task.cancelled():
+        return
+    logger.error(f"Outbox worker stopped, restarting in {OUTBOX_RESTART_DELAY}s", exc_info=task.exception())
+    asyncio.get_running_loop().call_later(OUTBOX_RESTART_DELAY, start_outbox, worker)
+
+
+async def start_bot():
+    dp = await setup_dispatcher(RedisStorage.from_url(app_config.redis.url))
+
     cron_job = aiocron.crontab('0 9 * * *', func=notify_everyday_tasks_deadlines, start=True)
+    start_outbox(OutboxWorker.from_config(app_config.telegram))
 
     await dp.start_polling(bot, skip_updates=False)
 
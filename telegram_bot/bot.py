@@ -3,9 +3,14 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
 from shared.app_config import app_config
+from telegram_bot.rate_limiter import TelegramRateLimiter
 
 bot = Bot(token=app_config.telegram.token,
           default=DefaultBotProperties(
               parse_mode=ParseMode.HTML,
               link_preview_is_disabled=True
           ))
+
+# один лимитер на все запросы бота: обработчики, рассылки по крону и уведомления из вебприложения
+rate_limiter = TelegramRateLimiter.from_config(app_config.telegram)
+bot.session.middleware(rate_limiter)
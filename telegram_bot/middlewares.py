@@ -4,8 +4,23 @@ from aiogram import BaseMiddleware
 from aiogram.types import InlineQueryResultArticle, InputTextMessageContent
 from aiogram.types import TelegramObject, Update, Message, CallbackQuery, InlineQuery
 
-from database import async_dbsession
-from shared.db import get_user_by_tg
+from database import async_dbsession, track_queries, consistency_scope
+from shared.app_config import app_config
+from shared.cache import user_cache
+from shared.db import get_cached_user_by_tg
+
+
+class QueryStatsMiddleware(BaseMiddleware):
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        name = f"update {event.update_id} ({event.event_type})" if isinstance(event, Update) else type(event).__name__
+        with track_queries(name, app_config.database.query_log_threshold,
+                           app_config.database.query_repeat_threshold):
+            return await handler(event, data)
 
 
 class UserAndDBSessionCheckMiddleware(BaseMiddleware):
@@ -31,34 +46,39 @@ class UserAndDBSessionCheckMiddleware(BaseMiddleware):
         if not telegram_id:
             return await handler(event, data)
 
-        async with async_dbsession() as session:
-            user = await get_user_by_tg(telegram_id, session)
-            if not user:
-                await self._send_response(
-                    event,
-                    "Ваш аккаунт не связан с пользователем "
-                    "<a href='{app_config.domain}'>нашей системы</a>. "
-                    "Зарегистрируйтесь и дождитесь верификации администратором")
-                return
-            if not user.active:
-                await self._send_response(
-                    event, "Ваш аккаунт деактивирован. "
-                           "Обратитесь к администратору.")
-                return
-            if not user.verificated:
-                await self._send_response(
-                    event,
-                    "Ваш аккаунт на верификации. "
-                    "Обратитесь к администратору для ускорения.")
-                return
+        user = await get_cached_user_by_tg(telegram_id)
+        if not user:
+            await self._send_response(
+                event,
+                "Ваш аккаунт не связан с пользователем "
+                "<a href='{app_config.domain}'>нашей системы</a>. "
+                "Зарегистрируйтесь и дождитесь верификации администратором")
+            return
+        if not user.active:
+            await self._send_response(
+                event, "Ваш аккаунт деактивирован. "
+                       "Обратитесь к администратору.")
+            return
+        if not user.verificated:
+            await self._send_response(
+                event,
+                "Ваш аккаунт на верификации. "
+                "Обратитесь к администратору для ускорения.")
+            return
 
-            if user.telegram_nick != username:
-                user.telegram_nick = username
-                await session.commit()
+        # после своих изменений пользователь какое-то время читает с основной БД, а не с реплики
+        with consistency_scope(telegram_id):
+            async with async_dbsession() as session:
+                # пользователь из кэша, привязываем к сессии без запроса в БД
+                user = await session.merge(user, load=False)
+                if user.telegram_nick != username:
+                    user.telegram_nick = username
+                    await session.commit()
+                    user_cache.invalidate(telegram_id)
 
-            data['db'] = session
-            data["user"] = user
-            return await handler(event, data)
+                data['db'] = session
+                data["user"] = user
+                return await handler(event, data)
 
     @staticmethod
     async def _send_response(self, event: TelegramObject, message: str):
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import Enum
+from typing import Iterator
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod, Response
+from aiogram.methods.base import TelegramType
+
+from shared.app_config import TelegramConfig
+
+logger = logging.getLogger(__name__)
+
+
+class Lane(Enum):
+    INTERACTIVE = 'interactive'
+    BULK = 'bulk'
+
+
+_lane: ContextVar[Lane] = ContextVar('telegram_lane', default=Lane.INTERACTIVE)
+
+
+@contextmanager
+def bulk_lane() -> Iterator[None]:
+    """Запросы к Bot API внутри блока (и порождённых им задач) уступают интерактивным: рассылки, напоминания."""
+    token = _lane.set(Lane.BULK)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, reserve: float = 0) -> float:
+        """Через сколько секунд в корзине будет токен сверх reserve."""
+        self._refill()
+        missing = 1 + reserve - self.tokens
+        return max(missing, 0) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class TelegramRateLimiter(BaseRequestMiddleware):
+    """
+    Общий для всех отправителей лимит запросов к Bot API: глобальная корзина (около 30 сообщений в секунду
+    на бота) и корзины по чатам (около одного сообщения в секунду в чат, с небольшим запасом на серию правок).
+    Ограничиваются только методы с chat_id; getUpdates, answerCallbackQuery и прочие идут без очереди.
+
+    Массовые рассылки (bulk_lane) не берут последние bulk_reserve глобальных токенов и ждут, пока есть
+    интерактивные запросы, упёршиеся в глобальный лимит, - ответы пользователям не стоят за утренней пачкой.
+    Если Telegram всё же ответил 429, весь бот ставится на паузу на retry_after и запрос повторяется один раз.
+    """
+
+    def __init__(self, rate: float = 30, chat_rate: float = 1, chat_burst: int = 5, bulk_reserve: int = 5):
+        self.global_bucket = TokenBucket(rate, rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.bulk_reserve = bulk_reserve
+        self._chats: dict[int | str, TokenBucket] = {}
+        self._paused_until = 0.0
+        # интерактивные запросы, которые ждут именно глобальную корзину
+        self._interactive_waiting = 0
+        self.requests = Counter()
+        self.waited = Counter()
+        self.wait_time = Counter()
+        self.retry_after = 0
+
+    @classmethod
+    def from_config(cls, config: TelegramConfig) -> 'TelegramRateLimiter':
+        return cls(config.rate_limit, config.chat_rate_limit, config.chat_burst, config.bulk_reserve)
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # полная корзина ничем не отличается от новой, такие не храним
+            if len(self._chats) > 1000:
+                self._chats = {chat: b for chat, b in self._chats.items() if not b.full}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def acquire(self, chat_id: int | str, lane: Lane):
+        chat_bucket = self._chat_bucket(chat_id)
+        started = time.monotonic()
+        counted = False
+        try:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                chat_delay = chat_bucket.delay()
+                if lane == Lane.BULK:
+                    global_delay = self.global_bucket.delay(self.bulk_reserve)
+                    if self._interactive_waiting:
+                        global_delay = max(global_delay, 1 / self.global_bucket.rate)
+                else:
+                    global_delay = self.global_bucket.delay()
+                    if global_delay > 0 and not counted:
+                        self._interactive_waiting += 1
+                        counted = True
+                delay = max(pause, chat_delay, global_delay)
+                if delay <= 0:
+                    self.global_bucket.take()
+                    chat_bucket.take()
+                    break
+                await asyncio.sleep(delay)
+        finally:
+            if counted:
+                self._interactive_waiting -= 1
+        self.requests[lane.value] += 1
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            self.waited[lane.value] += 1
+            self.wait_time[lane.value] += waited
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType[TelegramType],
+            bot: Bot,
+            method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None:
+            return await make_request(bot, method)
+        lane = _lane.get()
+        await self.acquire(chat_id, lane)
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            self.retry_after += 1
+            logger.warning(f"Telegram asked to retry after {e.retry_after}s ({type(method).__name__}, {lane.value})")
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            await self.acquire(chat_id, lane)
+            return await make_request(bot, method)
+
+    def stats(self) -> dict:
+        return {
+            'requests': dict(self.requests),
+            'waited': dict(self.waited),
+            'avg_wait_ms': {lane: round(self.wait_time[lane] / n * 1000, 1) for lane, n in self.waited.items()},
+            'retry_after': self.retry_after,
+        }
@@ -1,10 +1,9 @@
 from aiogram import Router, F
 from aiogram.types import Message
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import User, TaskNotification
-from shared.db import add_comment, get_task_by_id
+from database.models import User, Task, TaskNotification
+from shared.db import add_comment, get_notification_by_message
 from telegram_bot.utils.keyboards import generate_status_keyboard
 from telegram_bot.utils.send_tasks import get_telegram_task_text, send_task_message
 
@@ -24,18 +23,15 @@ async def handle_reply(message: Message, user: User, db: AsyncSession):
     telegram_id = message.from_user.id
     reply_message_id = message.reply_to_message.message_id
 
-    notification: TaskNotification = (await db.execute(select(TaskNotification).filter_by(
-        telegram_message_id=reply_message_id,
-        user_id=user.id,
-        active=True
-    ))).scalar_one_or_none()
+    notification: TaskNotification = await get_notification_by_message(reply_message_id, user.id, db)
 
     if not notification:
         await message.reply(
             "Комментировать можно только задачи. Не получилось найти задачу, связанную с сообщением")
         return
 
-    task = await get_task_by_id(notification.task_id, db)
+    # для карточки достаточно самой задачи: последние комментарии лежат в Task.recent_activity
+    task = await db.get(Task, notification.task_id)
     if not task:
         await message.answer("Задача более недоступна в базе")
         return
@@ -0,0 +1,38 @@
+from datetime import date
+
+from aiogram import Router
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import User, Task
+from telegram_bot.utils.keyboards import DigestPageCallback, DigestTaskCallback, generate_status_keyboard
+from telegram_bot.utils.notifications import get_user_deadline_tasks, render_digest_page
+from telegram_bot.utils.send_tasks import send_task_message, get_telegram_task_text, check_task
+
+router = Router()
+
+
+@router.callback_query(DigestPageCallback.filter())
+async def digest_page(call: CallbackQuery, callback_data: DigestPageCallback, user: User):
+    # сводка собирается заново: закрытые с утра задачи из неё пропадают
+    now = date.today()
+    tasks = await get_user_deadline_tasks(user, now)
+    text, markup = render_digest_page(tasks, callback_data.page, now)
+    try:
+        await call.message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+    await call.answer()
+
+
+@router.callback_query(DigestTaskCallback.filter())
+async def digest_task(call: CallbackQuery, callback_data: DigestTaskCallback, user: User, db: AsyncSession):
+    task = await db.get(Task, callback_data.task_id)
+    if not task:
+        return await call.answer("Задача не найдена", show_alert=True)
+    task = await check_task(task, db)
+    await send_task_message(get_telegram_task_text(task), task, user, db=db,
+                            markup=generate_status_keyboard(user, task))
+    await call.answer()
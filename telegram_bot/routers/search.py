@@ -0,0 +1,81 @@
+import html
+import logging
+from typing import Optional
+from urllib.parse import quote
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
+from redis.exceptions import RedisError
+
+from shared.app_config import app_config
+from shared.cache import redis_cache
+from shared.db import search_tasks, search_max_page
+from telegram_bot.routers.tasks import task_list_item
+from telegram_bot.utils.keyboards import SearchPageCallback
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+commands = {
+    'search': "Поиск задач по тексту"
+}
+
+BOT_SEARCH_PAGE_SIZE = 10
+# текст запроса для кнопок листания хранится по сообщению с результатами
+SEARCH_QUERY_KEY = "bot_search"
+SEARCH_QUERY_TTL = 86400
+
+
+def search_query_key(message: Message) -> str:
+    return f"{SEARCH_QUERY_KEY}:{message.chat.id}:{message.message_id}"
+
+
+async def render_search_page(query: str, page: int) -> tuple[str, Optional[InlineKeyboardMarkup]]:
+    # своя сессия в search_tasks: поиск читается с реплики
+    results, has_next = await search_tasks(query, page, BOT_SEARCH_PAGE_SIZE)
+    if not results:
+        return (f"По запросу «{html.escape(query)}» ничего не найдено.\n"
+                f"Слова короче трёх букв не учитываются."), None
+
+    url = f"{app_config.domain}/tasks/search?q={quote(query)}"
+    text = [f"<a href='{url}'>Поиск</a>: «{html.escape(query)}», страница {page}"]
+    id_len = len(str(max(task.id for task, _ in results)))
+    text.extend(task_list_item(task, id_len) for task, _ in results)
+
+    buttons = []
+    if page > 1:
+        buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=SearchPageCallback(page=page - 1).pack()))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text="Дальше ▶️", callback_data=SearchPageCallback(page=page + 1).pack()))
+    return "\n".join(text), InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+
+@router.message(Command(commands=["search"]))
+async def search_command(message: Message, command: CommandObject):
+    query = (command.args or "").strip()
+    if not query:
+        return await message.answer("Напишите, что искать: <code>/search договор поставки</code>")
+    text, markup = await render_search_page(query, 1)
+    sent = await message.answer(text, reply_markup=markup, disable_web_page_preview=True)
+    if markup:
+        try:
+            await redis_cache.set(search_query_key(sent), query, ex=SEARCH_QUERY_TTL)
+        except RedisError as e:
+            logger.warning(f"Search query is not saved: {e}")
+
+
+@router.callback_query(SearchPageCallback.filter())
+async def search_page(call: CallbackQuery, callback_data: SearchPageCallback):
+    try:
+        query = await redis_cache.get(search_query_key(call.message))
+    except RedisError:
+        query = None
+    if query is None:
+        return await call.answer("Поиск устарел, повторите /search", show_alert=True)
+    # номер страницы приходит от клиента, в поиск дальше допустимой не пускаем
+    page = min(max(callback_data.page, 1), search_max_page(BOT_SEARCH_PAGE_SIZE))
+    text, markup = await render_search_page(query.decode(), page)
+    await call.message.edit_text(text, reply_markup=markup, disable_web_page_preview=True)
+    await call.answer()
@@ -8,6 +8,7 @@ from aiogram.types import CallbackQuery, Message
 from database.models import is_valid_transition, SHOULD_BE_COMMENTED, COMPLETED_STATUSES
 from shared.app_config import app_config
 from shared.db import *
+from shared.notification_ledger import NotificationLedger, notification_ledger
 from telegram_bot.utils.keyboards import *
 from telegram_bot.utils.message_magic import edit_or_resend_message, send_autodelete_message
 from telegram_bot.utils.notifications import send_notify
@@ -118,7 +119,7 @@ async def run_status_change(task: Task, user: User, new_status: Statuses, db: As
                             callback_query: CallbackQuery = None, comment=None):
     async with get_db_safety(db) as db:
         task = await db.merge(task)
-        previous_status = task.status.value
+        previous_status = task.status
         change = await status_change(task, user, new_status, comment, db=db)
         if not change:
             if callback_query:
@@ -127,21 +128,35 @@ async def run_status_change(task: Task, user: User, new_status: Statuses, db: As
         if callback_query:
             await callback_query.answer(f"Статус изменен на {new_status.value}")
 
-        user_to_notify = task.whom_notify()
         message = callback_query and callback_query.message
+        if await notify_status_change(task, user, previous_status, new_status, db, message):
+            return change
+
+
+async def notify_status_change(task: Task, user: User, previous_status: Statuses, new_status: Statuses,
+                               db: AsyncSession = None, message: Message = None,
+                               ledger: NotificationLedger = None) -> bool:
+    # уведомления после смены статуса; из вебприложения вызывается очередью уведомлений
+    async with get_db_safety(db) as db, notification_ledger(db, ledger) as ledger:
+        task = await db.merge(task)
+        user_to_notify = task.whom_notify()
         info = (f"Статус задачи /{task.id} успешно изменён\n"
-                f"\"<b>{previous_status}</b>\" → \"<b>{new_status.value}</b>\".\n\n")
+                f"\"<b>{previous_status.value}</b>\" → \"<b>{new_status.value}</b>\".\n\n")
+        # сообщения, которых нет в TaskNotification, при повторе из очереди не отправляются второй раз
+        actor_key = f"status:{task.id}:{new_status.name}:{user.id}"
         if new_status in COMPLETED_STATUSES:
-            await send_autodelete_message(
-                f"{info}"
-                f"<a href='{app_config.domain}/tasks/{task.id}'>Задача</a> в архиве",
-                # f"<a href='{app_config.domain}/tasks_archive'>архиве</a>.",
-                chat_id=user.telegram_id,
-                message=message)
+            if not ledger.was_delivered(actor_key):
+                await send_autodelete_message(
+                    f"{info}"
+                    f"<a href='{app_config.domain}/tasks/{task.id}'>Задача</a> в архиве",
+                    # f"<a href='{app_config.domain}/tasks_archive'>архиве</a>.",
+                    chat_id=user.telegram_id,
+                    message=message)
+                ledger.mark_delivered(actor_key)
 
             notifications = await get_notifications(task.id, db=db)
-            await delete_notifications(notifications, db)
-            return
+            await delete_notifications(notifications, db, ledger)
+            return False
 
         if not user_to_notify:
             await add_error(task.id, f"Не получилось определить ответственного за статус {new_status.value}", user.id)
@@ -156,24 +171,26 @@ async def run_status_change(task: Task, user: User, new_status: Statuses, db: As
             else:
                 from telegram_bot.bot import bot
                 await bot.send_message(task.supplier.telegram_id, text)
-            return
+            return False
 
-        logging.info(f"run_status_change {previous_status} -> {new_status.value} "
+        logging.info(f"run_status_change {previous_status.value} -> {new_status.value} "
                      f"notify {user_to_notify.id}::{user_to_notify.full_name} "
                      f"actor {user.id}::{user.full_name}")
 
         if user_to_notify.id != user.id:
             notifications = await get_notifications(task.id, user.id, db)
-            await delete_notifications(notifications, db)
+            await delete_notifications(notifications, db, ledger)
 
-            await send_autodelete_message(
-                f"{info}"
-                f"Текущий ответственный: <a href='{user.telegram_bot_link}'>{user_to_notify.full_name}</a>.\n"
-                f"Система отправит уведомление и проконтролирует исполнение.",
-                chat_id=user.telegram_id,
-                message=message)
+            if not ledger.was_delivered(actor_key):
+                await send_autodelete_message(
+                    f"{info}"
+                    f"Текущий ответственный: <a href='{user.telegram_bot_link}'>{user_to_notify.full_name}</a>.\n"
+                    f"Система отправит уведомление и проконтролирует исполнение.",
+                    chat_id=user.telegram_id,
+                    message=message)
+                ledger.mark_delivered(actor_key)
 
         await db.refresh(task)
-        notify = await send_notify(task, db, may_edit=True, full_refresh=True,
-                                   event_msg=f"Смена статуса на: {new_status.value}")
-        return change
+        await send_notify(task, db, may_edit=True, full_refresh=True, ledger=ledger,
+                          event_msg=f"Смена статуса на: {new_status.value}")
+        return True
@@ -3,11 +3,11 @@ from aiogram.filters import Command
 from aiogram.types import Message
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import UserRole, User
+from database.models import UserRole, User, Task
 from shared.app_config import app_config
-from shared.db import get_user_tasks, get_task_by_id
+from shared.db import get_user_tasks
 from telegram_bot.utils.notifications import generate_status_keyboard
-from telegram_bot.utils.send_tasks import send_task_message, get_telegram_task_text
+from telegram_bot.utils.send_tasks import send_task_message, get_telegram_task_text, check_task
 from telegram_bot.utils.split_by_limit import split_message_by_limit
 
 router = Router()
@@ -19,9 +19,23 @@ commands = {
 DESCRIPTION_TRIM_SIZE = 65
 
 
+def task_list_item(task: Task, id_len: int) -> str:
+    description = task.description[:DESCRIPTION_TRIM_SIZE]
+    if len(task.description) > DESCRIPTION_TRIM_SIZE:
+        if " " in description:
+            description = description[:description.rfind(" ")] + "…"
+        else:
+            description = description + "…"
+
+    return (f"\n/{task.id:0{id_len}d} {task.actual_plan_date.strftime('%d.%m.%y')} :: "
+            f"<a href='{app_config.domain}/tasks/{task.id}'>{task.task_type.name}</a>\n"
+            f"{description}")
+
+
 @router.message(Command(commands=["tasks"]))
 async def list_tasks(message: Message, user: User, db: AsyncSession):
-    tasks = await get_user_tasks(user.id, db)
+    # список только читается, пусть идёт на реплику
+    tasks = await get_user_tasks(user.id)
 
     result = [f"<a href='{app_config.domain}/tasks'>Активные задачи пользователя</a>\n{user.full_name}"]
 
@@ -31,17 +45,7 @@ async def list_tasks(message: Message, user: User, db: AsyncSession):
             result.append(f"\n\n<b>{str(role)}</b>")
             max_id_len = len(str(max(task.id for task in task_list)))
             for task in task_list:
-                description = task.description[:DESCRIPTION_TRIM_SIZE]
-                if len(task.description) > DESCRIPTION_TRIM_SIZE:
-                    if " " in description:
-                        description = description[:description.rfind(" ")] + "…"
-                    else:
-                        description = description + "…"
-
-                task_info = (f"\n/{task.id:0{max_id_len}d} {task.actual_plan_date.strftime('%d.%m.%y')} :: "
-                             f"<a href='{app_config.domain}/tasks/{task.id}'>{task.task_type.name}</a>\n"
-                             f"{description}")
-                result.append(task_info)
+                result.append(task_list_item(task, max_id_len))
     if len(result) < 2:
         result.append("\n\n<i>Нет задач</i>")
     messages = split_message_by_limit(result)
@@ -52,9 +56,10 @@ async def list_tasks(message: Message, user: User, db: AsyncSession):
 @router.message(lambda message: message.text and message.text.lstrip('/').isdigit())
 async def handle_task_by_id(message: Message, db: AsyncSession, user: User):
     task_id = int(message.text.lstrip('/'))
-    task = await get_task_by_id(task_id, db)
+    task = await db.get(Task, task_id)
     if not task:
         return await message.reply("Задача не найдена.")
+    task = await check_task(task, db)
     task_info = get_telegram_task_text(task)
     markup = generate_status_keyboard(user, task)
     await send_task_message(task_info, task, user, user_message=message, db=db, markup=markup, may_edit=False)
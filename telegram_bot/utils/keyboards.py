@@ -18,6 +18,18 @@ class PlanDateChangeCallback(CallbackData, prefix="plan_date_change"):
     task_id: int
 
 
+class SearchPageCallback(CallbackData, prefix="search"):
+    page: int
+
+
+class DigestPageCallback(CallbackData, prefix="digest"):
+    page: int
+
+
+class DigestTaskCallback(CallbackData, prefix="digest_task"):
+    task_id: int
+
+
 cancel_callback_data = "cancel_commenting"
 cancel_button = InlineKeyboardButton(text="Отмена", callback_data=cancel_callback_data)
 cancel_keyboard = InlineKeyboardMarkup(inline_keyboard=[[cancel_button]])
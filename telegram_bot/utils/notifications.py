@@ -1,18 +1,36 @@
 import asyncio
 import logging
-from datetime import date, timedelta
+import math
+import time
+from dataclasses import dataclass
+from datetime import date
 from functools import lru_cache
+from typing import AsyncIterator
 
-from sqlalchemy import and_, select, or_
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from redis.exceptions import RedisError
+from sqlalchemy import or_
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
 
-from database import async_dbsession, get_db_safety
-from database.models import Task, NOTIFICATION_STATUSES, Comment, User, UserRole
-from shared.db import get_notifications, notify_sent, get_notified_users
-from telegram_bot.utils.keyboards import generate_status_keyboard
+from database import async_dbsession, get_db_safety, get_read_db_safety
+from database.models import Task, User, UserRole
+from shared.app_config import app_config
+from shared.cache import redis_cache
+from shared.db import get_notifications, get_notified_users, get_deadline_tasks_query
+from shared.notification_ledger import NotificationLedger, notification_ledger
+from telegram_bot.bot import bot
+from telegram_bot.rate_limiter import bulk_lane
+from telegram_bot.utils.keyboards import generate_status_keyboard, DigestPageCallback, DigestTaskCallback
 from telegram_bot.utils.send_tasks import get_telegram_task_text, send_task_message, delete_notifications, check_task
 
+DEADLINE_CHUNK_SIZE = 500
+DIGEST_PAGE_SIZE = 10
+DIGEST_BUTTONS_IN_ROW = 5
+# сообщение со вчерашней сводкой, его снимаем при отправке новой
+DIGEST_MESSAGE_KEY = "deadline_digest"
+DIGEST_MESSAGE_TTL = 2 * 86400
+
 
 @lru_cache(maxsize=None)
 def get_days_text(days_remain):
@@ -36,76 +54,245 @@ def build_event_message(days_remain):
         return f"Напоминание о просроченной задаче {abs(days_remain)} {get_days_text(abs(days_remain))} назад"
 
 
-async def notify_everyday_tasks_deadlines():
+@lru_cache(maxsize=None)
+def build_deadline_text(days_remain):
+    if days_remain > 0:
+        return f"через {days_remain} {get_days_text(days_remain)}"
+    elif days_remain == 0:
+        return "сегодня"
+    else:
+        return f"просрочена на {abs(days_remain)} {get_days_text(abs(days_remain))}"
+
+
+@dataclass
+class DeadlineRunStats:
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    skipped: int = 0
+    digests: int = 0
+    duration: float = 0
+
+    def __str__(self):
+        digests = f" ({self.digests} digests)" if self.digests else ""
+        return (f"{self.total} tasks: {self.sent} sent{digests}, {self.failed} failed, {self.skipped} skipped "
+                f"in {self.duration:.1f}s")
+
+
+async def scan_deadline_tasks(now: date) -> AsyncIterator[Task]:
+    # задачи по сроку читаются с реплики, если она есть, пачками по DEADLINE_CHUNK_SIZE через серверный курсор.
+    # Комментарии не грузятся: карточке хватает снимка Task.recent_activity
+    async with get_read_db_safety() as db:
+        query = get_deadline_tasks_query(now).execution_options(yield_per=DEADLINE_CHUNK_SIZE)
+        result = await db.stream(query)
+        async for tasks in result.scalars().partitions():
+            for task in tasks:
+                yield task
+
+
+async def notify_everyday_tasks_deadlines(workers: int = None, digest: bool = None) -> DeadlineRunStats:
+    """
+    Ежедневные напоминания о сроках. Задачи разбирают несколько обработчиков, у каждого своя сессия;
+    темп отправки задаёт общий лимитер бота, поэтому медленный ответ API задерживает только свой обработчик.
+    В режиме сводки (BOT_DEADLINE_DIGEST) каждый ответственный получает одно сообщение со списком задач
+    вместо карточки на каждую.
+    """
     now = date.today()
-    tomorrow = now + timedelta(days=1)
-    date_ranges = [(now + timedelta(days=x)) for x in [3, 7]]
-
-    tasks_query = select(Task).options(
-        joinedload(Task.comments).joinedload(Comment.user),
-        joinedload(Task.comments).joinedload(Comment.documents)
-    ).filter(
-        and_(
-            or_(
-                Task.actual_plan_date.in_(date_ranges),
-                Task.actual_plan_date <= tomorrow
-            ),
-            Task.status.in_(NOTIFICATION_STATUSES)
+    workers = workers or app_config.telegram.deadline_workers
+    digest = app_config.telegram.deadline_digest if digest is None else digest
+    send = send_deadline_digest if digest else send_deadline_reminder
+    stats = DeadlineRunStats()
+    started = time.monotonic()
+
+    # очередь ограничена, так что в памяти одновременно не больше пары пачек, сколько бы задач ни набралось.
+    # send_notify сливает задачу в сессию обработчика (merge перечитывает её по ключу),
+    # так что записи идут по актуальному состоянию
+    queue = asyncio.Queue(maxsize=DEADLINE_CHUNK_SIZE)
+
+    async def worker():
+        async with async_dbsession() as db:
+            while (item := await queue.get()) is not None:
+                await send(item, now, db, stats)
+                # identity map держит задачи слабо, но снимаем их явно, чтобы сессия не росла за время рассылки
+                db.expunge_all()
+
+    async def produce():
+        recipients: dict[int, User] = {}
+        async for task in scan_deadline_tasks(now):
+            stats.total += 1
+            if not digest:
+                await queue.put(task)
+            elif user := task.whom_notify():
+                # задачи ответственного сводка перечитывает сама, здесь копятся только получатели
+                recipients.setdefault(user.id, user)
+            else:
+                logging.warning(f"No relevant user to notify about {task} - {task.description}")
+                stats.skipped += 1
+        for user in recipients.values():
+            await queue.put(user)
+        for _ in range(workers):
+            await queue.put(None)
+
+    # напоминания уступают ответам пользователям, см. TelegramRateLimiter.
+    # Чтение и обработчики в одной группе: если обработчик упал, чтение, ждущее места в очереди,
+    # отменяется вместе с остальными, и рассылка завершается ошибкой, а не зависает
+    with bulk_lane():
+        async with asyncio.TaskGroup() as group:
+            group.create_task(produce())
+            for _ in range(workers):
+                group.create_task(worker())
+
+    stats.duration = time.monotonic() - started
+    logging.info(f"Deadline reminders: {stats}")
+    return stats
+
+
+async def send_deadline_reminder(task: Task, now: date, db: AsyncSession, stats: DeadlineRunStats):
+    event_msg = build_event_message((task.actual_plan_date - now).days)
+    try:
+        async with notification_ledger(db) as ledger:
+            await send_notify(task, db, event_msg=event_msg, may_edit=False, mark=True, ledger=ledger)
+            sent, errors = ledger.sent_count, ledger.error_count
+    except Exception as e:
+        # ошибка одной задачи не останавливает рассылку
+        logging.exception(f"Failed to send deadline reminder for task {task.id}: {e}")
+        await db.rollback()
+        stats.failed += 1
+        return
+    if errors:
+        stats.failed += 1
+    elif sent:
+        stats.sent += 1
+    else:
+        stats.skipped += 1
+
+
+async def get_user_deadline_tasks(user: User, now: date, db: AsyncSession = None) -> list[Task]:
+    """Задачи со сроком, за которые сейчас отвечает пользователь, - содержимое его сводки."""
+    async with get_read_db_safety(db) as db:
+        query = get_deadline_tasks_query(now).filter(
+            or_(Task.supplier_id == user.id, Task.supervisor_id == user.id, Task.executor_id == user.id)
         )
-    ).order_by(Task.actual_plan_date)
+        tasks = (await db.execute(query)).scalars().all()
+    return [task for task in tasks if (recipient := task.whom_notify()) and recipient.id == user.id]
+
+
+def render_digest_page(tasks: list[Task], page: int, now: date) -> tuple[str, InlineKeyboardMarkup | None]:
+    if not tasks:
+        return "Задач с подходящим сроком больше нет.", None
+    pages = math.ceil(len(tasks) / DIGEST_PAGE_SIZE)
+    page = min(max(page, 1), pages)
+    page_tasks = tasks[(page - 1) * DIGEST_PAGE_SIZE:page * DIGEST_PAGE_SIZE]
+
+    header = f"<b>Напоминание о сроках</b>\nЗадач: {len(tasks)}"
+    if pages > 1:
+        header += f", страница {page} из {pages}"
+    text = [header]
+    for task in page_tasks:
+        text.append(f"\n/{task.id} <a href='{app_config.domain}/tasks/{task.id}'>{task.task_type.name}</a> "
+                    f":: {task.object.name}\n"
+                    f"Срок {task.formatted_plan_date}, {build_deadline_text((task.actual_plan_date - now).days)}")
 
-    async with async_dbsession() as db:
-        tasks = (await db.execute(tasks_query)).scalars().unique().all()
+    buttons = [InlineKeyboardButton(text=f"№ {task.id}", callback_data=DigestTaskCallback(task_id=task.id).pack())
+               for task in page_tasks]
+    keyboard = [buttons[i:i + DIGEST_BUTTONS_IN_ROW] for i in range(0, len(buttons), DIGEST_BUTTONS_IN_ROW)]
+    navigation = []
+    if page > 1:
+        navigation.append(InlineKeyboardButton(text="◀️ Назад", callback_data=DigestPageCallback(page=page - 1).pack()))
+    if page < pages:
+        navigation.append(InlineKeyboardButton(text="Дальше ▶️", callback_data=DigestPageCallback(page=page + 1).pack()))
+    if navigation:
+        keyboard.append(navigation)
+    return "\n".join(text), InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-        for task in tasks:
-            days_remain = (task.actual_plan_date - now).days
-            event_msg = build_event_message(days_remain)
 
-            await send_notify(task, db, event_msg=event_msg, may_edit=False, mark=True)
-            await asyncio.sleep(0.1)
+async def replace_digest_message(user: User, message_id: int):
+    key = f"{DIGEST_MESSAGE_KEY}:{user.telegram_id}"
+    try:
+        previous = await redis_cache.get(key)
+        await redis_cache.set(key, message_id, ex=DIGEST_MESSAGE_TTL)
+    except RedisError as e:
+        logging.warning(f"Digest message is not saved: {e}")
+        return
+    if previous:
+        try:
+            await bot.delete_message(user.telegram_id, int(previous))
+        except TelegramAPIError as e:
+            logging.info(f"Previous digest {previous} for {user.telegram_id} is not deleted: {e}")
+
+
+async def send_deadline_digest(user: User, now: date, db: AsyncSession, stats: DeadlineRunStats):
+    # одно сообщение на ответственного; карточки открываются кнопками, TaskNotification не создаются,
+    # а отметки о напоминании в истории задач остаются
+    tasks = []
+    try:
+        tasks = await get_user_deadline_tasks(user, now, db)
+        if not tasks:
+            return
+        text, markup = render_digest_page(tasks, 1, now)
+        async with notification_ledger(db) as ledger:
+            try:
+                message = await bot.send_message(user.telegram_id, text, reply_markup=markup)
+            except TelegramAPIError as e:
+                logging.error(f"Failed to send deadline digest to {user.telegram_id}: {e}")
+                for task in tasks:
+                    ledger.error(task.id, f"Ошибка отправки сводки напоминаний:\n{e}", user.id)
+                stats.failed += len(tasks)
+                return
+            for task in tasks:
+                ledger.reminder_sent(task, user)
+    except Exception as e:
+        logging.exception(f"Failed to send deadline digest to user {user.id}: {e}")
+        await db.rollback()
+        stats.failed += len(tasks)
+        return
+    await replace_digest_message(user, message.message_id)
+    stats.sent += len(tasks)
+    stats.digests += 1
 
 
 async def send_notify(task: Task, db: AsyncSession = None,
                       event_msg: str = "",
-                      may_edit=False, mark=False, full_refresh: bool = False):
-    async with get_db_safety(db) as db:
+                      may_edit=False, mark=False, full_refresh: bool = False,
+                      ledger: NotificationLedger = None):
+    async with get_db_safety(db) as db, notification_ledger(db, ledger) as ledger:
         task = await db.merge(task)
         task = await check_task(task, db)
         user_to_notify = task.whom_notify()
         if not user_to_notify:
             logging.warning(f"No relevant user to notify about {task} - {task.description}")
             notifications = await get_notifications(task.id, db=db)
-            await delete_notifications(notifications, db)
+            await delete_notifications(notifications, db, ledger)
             return
 
         text = get_telegram_task_text(task, event_msg)
         notify = {user_to_notify}
         if full_refresh:
-            notify.update(await get_notified_users(task.id))
+            notify.update(await get_notified_users(task.id, db))
         result = None
         for user in notify:
             target = user.id != user_to_notify.id
             roles = task.get_user_roles_text(user.id)
             roles = roles and f"\n\n<i>Вы: {roles}</i>"
             msg = await send_task_message(f"{text}{roles}", task, user, may_edit=may_edit, no_new=target,
-                                          db=db, markup=generate_status_keyboard(user, task))
+                                          db=db, markup=generate_status_keyboard(user, task), ledger=ledger)
             if target:
                 result = msg
         if mark:
-            await notify_sent(task, user_to_notify, db)
+            ledger.reminder_sent(task, user_to_notify)
         return result
 
 
 async def notify_when_user_changed(task: Task, old_user: User, new_user: User, role: UserRole, db: AsyncSession = None,
-                                   may_edit=True, mark=False):
-    async with get_db_safety(db) as db:
+                                   may_edit=True, mark=False, ledger: NotificationLedger = None):
+    async with get_db_safety(db) as db, notification_ledger(db, ledger) as ledger:
         task = await db.merge(task)
         notifications = await get_notifications(task.id, old_user.id, db)
-        await delete_notifications(notifications, db)
-        await send_notify(task=task, may_edit=may_edit, db=db, mark=mark, full_refresh=True,
+        await delete_notifications(notifications, db, ledger)
+        await send_notify(task=task, may_edit=may_edit, db=db, mark=mark, full_refresh=True, ledger=ledger,
                           event_msg=f"{role.value} сменился\n"
                                     f"{old_user.full_name} → {new_user.full_name}")
 
 
 if __name__ == "__main__":
-    asyncio.run(notify_everyday_tasks_deadlines())
+    print(asyncio.run(notify_everyday_tasks_deadlines()))
@@ -0,0 +1,201 @@
+"""
+Очередь уведомлений в телеграм (таблица notification_outbox). Вебприложение не отправляет сообщения само:
+enqueue добавляет задание в сессию запроса и оно сохраняется вместе с изменением задачи,
+а OutboxWorker в процессе бота разбирает очередь.
+
+Задание хранит только идентификаторы, обработчик перечитывает задачу и строит карточку по текущему состоянию,
+поэтому повтор не плодит сообщения: старые карточки правятся или снимаются, как при любом уведомлении.
+Что успело уйти до сбоя, записывается (NotificationLedger.flush_after_error), а ключи доставленного
+сохраняются в задании: повтор не шлёт их второй раз, в том числе сообщения вне TaskNotification.
+Временные сбои (429, сеть, 5xx) повторяются с экспоненциальной задержкой, но не раньше retry_after,
+после OUTBOX_MAX_ATTEMPTS попыток задание помечается failed, а в задачу пишется ошибка.
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from sqlalchemy import select, update, delete, or_, and_, exists, event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from database import async_dbsession
+from database.models import OutboxMessage, OutboxStatus, Task, User, UserRole, Statuses
+from shared.app_config import TelegramConfig
+from shared.db import add_error
+from shared.notification_ledger import NotificationLedger
+from telegram_bot.routers.statuses import notify_status_change
+from telegram_bot.utils.notifications import send_notify, notify_when_user_changed
+from telegram_bot.utils.send_tasks import broadcast_task
+
+OUTBOX_POLL_INTERVAL = 1  # секунды; задания из другого процесса подхватываются не позже
+OUTBOX_LEASE = timedelta(minutes=5)  # задание упавшего обработчика забирается снова по истечении
+BACKOFF_BASE = 2  # секунды, удваивается с каждой попыткой
+BACKOFF_MAX = 15 * 60
+
+# будит обработчики этого процесса после коммита, не дожидаясь опроса
+_wakeup = asyncio.Event()
+
+Handler = Callable[[Task, dict, AsyncSession, NotificationLedger, bool], Awaitable]
+
+
+async def _notify(task: Task, payload: dict, db: AsyncSession, ledger: NotificationLedger, retry: bool):
+    # при повторе карточка могла уже уйти, её правим, а не шлём вторую
+    await send_notify(task, db, event_msg=payload.get('event_msg', ""), may_edit=payload.get('may_edit') or retry,
+                      full_refresh=payload.get('full_refresh', False), ledger=ledger)
+
+
+async def _user_changed(task: Task, payload: dict, db: AsyncSession, ledger: NotificationLedger, retry: bool):
+    old_user = await db.get(User, payload['old_user_id'])
+    new_user = await db.get(User, payload['new_user_id'])
+    await notify_when_user_changed(task, old_user, new_user, UserRole[payload['role']], db, ledger=ledger)
+
+
+async def _status_changed(task: Task, payload: dict, db: AsyncSession, ledger: NotificationLedger, retry: bool):
+    user = await db.get(User, payload['user_id'])
+    await notify_status_change(task, user, Statuses[payload['previous_status']], Statuses[payload['new_status']],
+                               db, ledger=ledger)
+
+
+async def _broadcast(task: Task, payload: dict, db: AsyncSession, ledger: NotificationLedger, retry: bool):
+    await broadcast_task(task, payload.get('comment'), db, ledger=ledger)
+
+
+HANDLERS: dict[str, Handler] = {
+    'notify': _notify,
+    'user_changed': _user_changed,
+    'status_changed': _status_changed,
+    'broadcast': _broadcast,
+}
+
+
+def _wake(session):
+    _wakeup.set()
+
+
+def enqueue(db: AsyncSession, kind: str, task_id: int, **payload) -> OutboxMessage:
+    """Ставит уведомление в очередь в транзакции вызывающего; коммит за ним."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown outbox message kind: {kind}")
+    message = OutboxMessage(kind=kind, task_id=task_id, payload=payload, status=OutboxStatus.pending,
+                            attempts=0, next_attempt_at=datetime.now())
+    db.add(message)
+    event.listen(db.sync_session, 'after_commit', _wake, once=True)
+    return message
+
+
+def backoff(attempts: int) -> float:
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class OutboxWorker:
+    def __init__(self, workers: int = 4, max_attempts: int = 8):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        # задания одной задачи не выполняются параллельно: карточки правятся и снимаются по очереди
+        self._active_tasks: set[int] = set()
+        self._claim_lock = asyncio.Lock()
+        # текущая задача run(), её ведёт telegram_bot.start_outbox
+        self.task: asyncio.Task | None = None
+
+    @classmethod
+    def from_config(cls, config: TelegramConfig) -> 'OutboxWorker':
+        return cls(config.outbox_workers, config.outbox_max_attempts)
+
+    async def run(self):
+        # при падении одного обработчика останавливаются все, и перезапуск не удваивает их число
+        async with asyncio.TaskGroup() as group:
+            for _ in range(self.workers):
+                group.create_task(self._worker())
+
+    async def _worker(self):
+        while True:
+            try:
+                message = await self._claim()
+            except Exception as e:
+                logging.error(f"Outbox claim failed: {e}")
+                message = None
+            if message is None:
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                _wakeup.clear()
+                continue
+            try:
+                await self._process(message)
+            finally:
+                self._active_tasks.discard(message.task_id)
+
+    async def _claim(self) -> OutboxMessage | None:
+        now = datetime.now()
+        busy = aliased(OutboxMessage)
+        async with self._claim_lock, async_dbsession() as db:
+            query = (
+                select(OutboxMessage)
+                .filter(
+                    or_(
+                        and_(OutboxMessage.status == OutboxStatus.pending, OutboxMessage.next_attempt_at <= now),
+                        and_(OutboxMessage.status == OutboxStatus.processing, OutboxMessage.locked_until < now)
+                    ),
+                    # задачу может держать обработчик другого процесса
+                    ~exists().where(busy.task_id == OutboxMessage.task_id, busy.id != OutboxMessage.id,
+                                    busy.status == OutboxStatus.processing, busy.locked_until >= now)
+                )
+                .order_by(OutboxMessage.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            if self._active_tasks:
+                query = query.filter(OutboxMessage.task_id.not_in(self._active_tasks))
+            message = await db.scalar(query)
+            if message is None:
+                return None
+            message.status = OutboxStatus.processing
+            message.locked_until = now + OUTBOX_LEASE
+            message.attempts += 1
+            await db.commit()
+            self._active_tasks.add(message.task_id)
+            return message
+
+    async def _process(self, message: OutboxMessage):
+        ledger = NotificationLedger(retry_transient=True, delivered=message.delivered or ())
+        try:
+            async with async_dbsession() as db:
+                task = await db.get(Task, message.task_id)
+                if task is not None:
+                    try:
+                        await HANDLERS[message.kind](task, message.payload, db, ledger, message.attempts > 1)
+                    except Exception:
+                        # доставленное до сбоя записываем, иначе повтор не сможет его править и пришлёт дубли
+                        await ledger.flush_after_error(db)
+                        raise
+                    await ledger.flush(db)
+        except Exception as e:
+            logging.exception(f"Outbox message {message.id} ({message.kind}, task {message.task_id}) failed: {e}")
+            await self._retry(message, repr(e), delivered=ledger.delivered)
+            return
+        if ledger.postponed:
+            await self._retry(message, "\n".join(ledger.postponed), ledger.retry_after, ledger.delivered)
+            return
+        async with async_dbsession() as db:
+            await db.execute(delete(OutboxMessage).where(OutboxMessage.id == message.id))
+            await db.commit()
+
+    async def _retry(self, message: OutboxMessage, err: str, retry_after: int = 0, delivered: set[str] = None):
+        async with async_dbsession() as db:
+            if message.attempts >= self.max_attempts:
+                logging.error(f"Outbox message {message.id} gave up after {message.attempts} attempts: {err}")
+                values = {'status': OutboxStatus.failed}
+                await add_error(message.task_id, f"Ошибка отправки уведомления:\n{err}", db=db)
+            else:
+                delay = max(backoff(message.attempts), retry_after)
+                values = {'status': OutboxStatus.pending, 'next_attempt_at': datetime.now() + timedelta(seconds=delay)}
+            await db.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id == message.id)
+                .values(locked_until=None, last_error=err, delivered=sorted(delivered or ()), **values)
+            )
+            await db.commit()
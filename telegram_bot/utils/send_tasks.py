@@ -1,16 +1,21 @@
 import logging
+from datetime import datetime
 
-from aiogram.exceptions import TelegramAPIError
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter, TelegramNetworkError, TelegramServerError
 from aiogram.types import Message, InlineKeyboardMarkup
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.db_sessionmaker import get_db_safety
 from database.models import Task, User, CommentType, Statuses
 from shared.app_config import app_config
-from shared.db import add_error, add_notification, get_notifications, get_task_by_id
+from shared.db import get_notifications, refresh_recent_activity
+from shared.notification_ledger import NotificationLedger, notification_ledger, card_key
 from telegram_bot.bot import bot
 from telegram_bot.utils.keyboards import generate_status_keyboard
 
+# сбои, после которых отправку имеет смысл повторить
+TRANSIENT_ERRORS = (TelegramRetryAfter, TelegramNetworkError, TelegramServerError)
+
 
 def get_telegram_task_text(task: Task, event: str = "") -> str:
     task_info = (
@@ -31,86 +36,84 @@ def get_telegram_task_text(task: Task, event: str = "") -> str:
     if event:
         task_info = f"<b>{event}</b>\n\n{task_info}"
 
-    if task.comments:
-        comments = []
-        has_comment = False
-
-        for comment in reversed(task.comments):
-            if comment.type in {CommentType.error, CommentType.notified, CommentType.notify_sent}:
-                continue
-            has_comment = has_comment or comment.type == CommentType.comment
-            comments.append(format_comment(comment))
-            if len(comments) >= 5 and has_comment:
-                break
-        comments.reverse()
+    if task.recent_activity:
+        comments = [format_comment(activity) for activity in task.recent_activity]
         task_info = f"{task_info}\n\n<b>Последние комментарии</b>\n\n{'\n\n'.join(comments)}"
 
     return task_info
 
 
-def format_comment(comment):
-    roles = ', '.join([role[0] for role in comment.author_roles])
-    comment_info = [f"<b>{comment.time_updated.strftime('%d.%m.%y %H:%M')}</b>"]
-    if comment.user:
-        comment_info.append(f"<b>{comment.user.short_name}</b>")
+def format_comment(activity: dict):
+    # activity - запись снимка Task.recent_activity, см. Comment.to_activity
+    comment_type = CommentType[activity['type']]
+    roles = ', '.join([role[0] for role in activity['roles']])
+    comment_info = [f"<b>{datetime.fromisoformat(activity['time']).strftime('%d.%m.%y %H:%M')}</b>"]
+    if activity['user']:
+        comment_info.append(f"<b>{activity['user']}</b>")
     if roles:
         comment_info.append(f"({roles})")
     comment_info = " ".join(comment_info)
 
-    if comment.type == CommentType.status_change:
+    if comment_type == CommentType.status_change:
         comment_info += (
-            f"\n🔁 Статус \"{Statuses[comment.previous_status].value}\" → "
-            f"\"{Statuses[comment.new_status].value}\""
+            f"\n🔁 Статус \"{Statuses[activity['previous_status']].value}\" → "
+            f"\"{Statuses[activity['new_status']].value}\""
         )
-    elif comment.type == CommentType.date_change:
-        diff_days = (comment.new_date - comment.old_date).days
+    elif comment_type == CommentType.date_change:
+        old_date = datetime.fromisoformat(activity['old_date'])
+        new_date = datetime.fromisoformat(activity['new_date'])
+        diff_days = (new_date - old_date).days
         comment_info += (
-            f"\n🗓 Срок до \"{comment.old_date.strftime('%d.%m.%Y')}\" → "
-            f"\"{comment.new_date.strftime('%d.%m.%Y')}\" "
+            f"\n🗓 Срок до \"{old_date.strftime('%d.%m.%Y')}\" → "
+            f"\"{new_date.strftime('%d.%m.%Y')}\" "
             f"({f'+{diff_days}' if diff_days > 0 else diff_days} дн.)"
         )
-    elif comment.type == CommentType.user_change:
+    elif comment_type == CommentType.user_change:
+        extra_data = activity['extra_data']
         comment_info += (
-            f"\n💁‍♂️ {'Исполнитель' if comment.extra_data['role'] == 'executor' else 'Руководитель'} "
-            f"\"{comment.extra_data['old_user']['name']}\" → "
-            f"\"{comment.extra_data['new_user']['name']}\""
+            f"\n💁‍♂️ {'Исполнитель' if extra_data['role'] == 'executor' else 'Руководитель'} "
+            f"\"{extra_data['old_user']['name']}\" → "
+            f"\"{extra_data['new_user']['name']}\""
         )
-    if comment.content:
-        if comment.type == CommentType.error:
-            comment_info += f"\n⚠️ <i>{comment.content.strip()}</i>"
+    if activity['content']:
+        if comment_type == CommentType.error:
+            comment_info += f"\n⚠️ <i>{activity['content'].strip()}</i>"
         else:
-            comment_info += (f"\n{'💬 ' if comment.type == CommentType.comment else ''}"
-                             f"{comment.content.strip()}")
+            comment_info += (f"\n{'💬 ' if comment_type == CommentType.comment else ''}"
+                             f"{activity['content'].strip()}")
 
-    if comment.documents:
+    if activity['documents']:
         documents_info = "\n".join(
-            f"- {doc.title}" if doc.deleted else f"- <a href='{app_config.domain}/documents/{doc.uuid}'>{doc.title}</a>"
-            for doc in comment.documents
+            f"- {doc['title']}" if doc['deleted']
+            else f"- <a href='{app_config.domain}/documents/{doc['uuid']}'>{doc['title']}</a>"
+            for doc in activity['documents']
         )
         comment_info += f"\n{documents_info}"
 
     return comment_info
 
 
-async def delete_notifications(notifications, db: AsyncSession):
-    for notification in notifications:
-        try:
-            await bot.delete_message(notification.user.telegram_id, notification.telegram_message_id)
-            notification.active = False
-            await db.commit()
-        except TelegramAPIError as e:
-            err = str(e)
-            if 'message to delete not found' in err:
-                notification.active = False
-                await db.commit()
-            else:
-                logging.error(f"Failed to delete message {notification.telegram_message_id}: {err}")
+async def delete_notifications(notifications, db: AsyncSession, ledger: NotificationLedger = None):
+    async with notification_ledger(db, ledger) as ledger:
+        for notification in notifications:
+            try:
+                await bot.delete_message(notification.user.telegram_id, notification.telegram_message_id)
+                ledger.deactivated(notification)
+            except TelegramAPIError as e:
+                err = str(e)
+                if 'message to delete not found' in err:
+                    ledger.deactivated(notification)
+                else:
+                    logging.error(f"Failed to delete message {notification.telegram_message_id}: {err}")
 
 
 async def send_task_message(text: str, task: Task, user: User, user_message: Message = None, db: AsyncSession = None,
                             markup: InlineKeyboardMarkup = None, may_edit: bool = False,
-                            no_new: bool = False) -> Message | None:
-    async with get_db_safety(db) as db:
+                            no_new: bool = False, ledger: NotificationLedger = None) -> Message | None:
+    async with get_db_safety(db) as db, notification_ledger(db, ledger) as ledger:
+        if ledger.was_delivered(card_key(task.id, user.id)):
+            # карточку уже доставила прошлая попытка этой рассылки, она записана в TaskNotification
+            return None
         task = await db.merge(task)
         notifications = await get_notifications(task.id, user.id, db)
         new_message = None
@@ -147,7 +150,7 @@ async def send_task_message(text: str, task: Task, user: User, user_message: Mes
                 logging.error(f"Failed to edit message {latest_notification.telegram_message_id}: {e}")
 
         # Удаление всех оставшихся уведомлений
-        await delete_notifications(notifications, db)
+        await delete_notifications(notifications, db, ledger)
 
         if not new_message and not no_new:
             try:
@@ -162,27 +165,30 @@ async def send_task_message(text: str, task: Task, user: User, user_message: Mes
                         text=text,
                         reply_markup=markup
                     )
-                await add_notification(task, user.id, new_message.message_id, db)
+                ledger.sent(task.id, user.id, new_message.message_id)
             except TelegramAPIError as e:
                 logging.error(f"Failed to send message to {user.telegram_id} for task {task.id}: {e}")
-                await add_error(task.id, f"Ошибка отправки уведомления:\n{e}", user.id, db)
+                if ledger.retry_transient and isinstance(e, TRANSIENT_ERRORS):
+                    ledger.postpone(str(e), getattr(e, 'retry_after', 0))
+                else:
+                    ledger.error(task.id, f"Ошибка отправки уведомления:\n{e}", user.id)
 
         return new_message
 
 
 async def check_task(task: Task, db: AsyncSession):
-    try:
-        len(task.comments)
-    except:
-        task = await get_task_by_id(task.id, db)
+    # карточке нужен только снимок последних комментариев; у задач, созданных до его появления,
+    # снимок собирается при первой отправке в транзакции вызывающего, коммитит журнал уведомлений
+    if task.recent_activity is None:
+        await refresh_recent_activity(task.id, db)
     return task
 
 
-async def broadcast_task(task: Task, comment=None, db: AsyncSession = None):
-    async with get_db_safety(db) as db:
+async def broadcast_task(task: Task, comment=None, db: AsyncSession = None, ledger: NotificationLedger = None):
+    async with get_db_safety(db) as db, notification_ledger(db, ledger) as ledger:
         task = await db.merge(task)
         task = await check_task(task, db)
         task_info = get_telegram_task_text(task, comment)
         for user in task.users:
-            await send_task_message(task_info, task, user, db=db,
+            await send_task_message(task_info, task, user, db=db, ledger=ledger,
                                     markup=generate_status_keyboard(user, task), may_edit=True)
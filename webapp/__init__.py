@@ -10,9 +10,9 @@ from fastapi.staticfiles import StaticFiles
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import webapp.filters
-from database import async_dbsession, get_db
+from database import get_read_db, consistency_scope, request_session_scope, track_queries
 from shared.app_config import app_config
-from shared.db import get_user_by_tg
+from shared.db import get_cached_user_by_tg
 from webapp.deps import redis, BASE_DIR, templates, generate_static_template
 from webapp.endpoints import auth, register, tasks
 from webapp.endpoints import tasks
@@ -52,7 +52,7 @@ def create_app() -> FastAPI:
         return RedirectResponse(url='/')
 
     @app.get("/", response_class=HTMLResponse)
-    async def root(request: Request, db: AsyncSession = Depends(get_db)):
+    async def root(request: Request, db: AsyncSession = Depends(get_read_db)):
         return await tasks.list_tasks(request, db)
 
     for module_name in modules:
@@ -83,8 +83,7 @@ def create_app() -> FastAPI:
             if not user_id:
                 return await auth.login(request, next_path=url_safe_path)
 
-            async with async_dbsession() as session:
-                user = await get_user_by_tg(user_id, session)
+            user = await get_cached_user_by_tg(user_id)
             if not user:
                 return await auth.login(request, next_path=url_safe_path)
 
@@ -96,7 +95,8 @@ def create_app() -> FastAPI:
             if module_data.get('only_admin') and not user.admin:
                 raise HTTPException(status_code=403, detail="У вас нет допуска для этого действия")
 
-            request.state.user = user
+            # пользователь из кэша, привязываем к сессии запроса без обращения к БД
+            request.state.user = await request.state.db.merge(user, load=False)
 
         timezone = request.headers.get('X-Timezone', 'UTC')
         try:
@@ -106,12 +106,24 @@ def create_app() -> FastAPI:
         request.state.timezone = timezone
 
         request.state.title = module_data.get('name', "")
-        response = await call_next(request)
+        # после своих изменений пользователь какое-то время читает с основной БД, а не с реплики
+        with consistency_scope(user_id):
+            response = await call_next(request)
         if user_id and device_id:
             await redis.set_token(user_id, device_id, response)
 
         return response
 
+    # регистрируется последним, поэтому оборачивает middleware выше: сессия запроса
+    # уже есть и при проверке пользователя, и в эндпоинтах через get_db
+    @app.middleware('http')
+    async def db_session_middleware(request: Request, call_next):
+        with track_queries(f"{request.method} {request.url.path}",
+                           app_config.database.query_log_threshold, app_config.database.query_repeat_threshold):
+            async with request_session_scope() as session:
+                request.state.db = session
+                return await call_next(request)
+
     error_handlers(app)
 
     return app
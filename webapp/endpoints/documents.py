@@ -9,8 +9,10 @@ from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
 from sqlalchemy.sql import func
 
-from database import get_db
+from database import get_db, get_read_db
 from database.models import Document, Comment
+from shared.cache import task_cache
+from shared.db import refresh_recent_activity
 from webapp.deps import templates
 from webapp.schemas import BulkDeleteRequest
 
@@ -48,7 +50,7 @@ async def list_documents(
         request: Request,
         page: int = Query(1, ge=1),
         page_size: int = Query(30, ge=1),
-        db: AsyncSession = Depends(get_db)
+        db: AsyncSession = Depends(get_read_db)
 ):
     offset = (page - 1) * page_size
 
@@ -85,7 +87,10 @@ async def delete_file_and_mark_deleted(document: Document, db: AsyncSession):
     if os.path.exists(file_path):
         os.remove(file_path)
     document.deleted = True
+    task_id = await db.scalar(select(Comment.task_id).filter(Comment.id == document.comment_id))
+    await refresh_recent_activity(task_id, db)
     await db.commit()
+    await task_cache.invalidate(task_id)
 
 
 @router.get("/delete/{uuid}", response_class=HTMLResponse)
@@ -7,6 +7,7 @@ from sqlalchemy.future import select
 from database import get_db
 from database.models import Organization, Object, TaskType
 from shared.app_config import app_config
+from shared.cache import reference_cache
 from webapp.deps import templates
 from webapp.schemas import *
 
@@ -135,6 +136,7 @@ async def save_item(request: Request,
         db.add(item)
 
     await db.commit()
+    reference_cache.clear()
     await db.refresh(item)
     return RedirectResponse(url=f'/references#{model}', status_code=303)
 
@@ -180,5 +182,6 @@ async def toggle_active_status(request: Request, model: str, action: str, item_i
     else:
         raise HTTPException(status_code=400, detail="Неверное действие")
     await db.commit()
+    reference_cache.clear()
     next_url = request.query_params.get("next", f"/references#{model}")
     return RedirectResponse(url=next_url, status_code=303)
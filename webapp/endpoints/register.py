@@ -9,6 +9,7 @@ from sqlalchemy.future import select
 
 from database import get_db
 from database.models import User
+from shared.cache import reference_cache, user_cache
 from webapp.deps import redis, templates
 from webapp.utils.RedisStore import REDIS_KEY_USER_REGISTER
 
@@ -91,6 +92,8 @@ async def register_user(
         db.add(user)
 
     await db.commit()
+    reference_cache.invalidate('users')
+    user_cache.invalidate(user_id)
     await db.refresh(user)
     response = RedirectResponse(next_url, status_code=303)
     await redis.set_token(user_id, device_id, response)
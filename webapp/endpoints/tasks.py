@@ -1,20 +1,18 @@
-import asyncio
 import os
 import shutil
 import uuid
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Request, Form, UploadFile, Depends
+from fastapi import APIRouter, HTTPException, Request, Form, UploadFile, Depends, Query
 from fastapi.responses import HTMLResponse, RedirectResponse
 from pydantic import ValidationError
 
-from database.db_sessionmaker import get_db
+from database.db_sessionmaker import get_db, get_read_db
 from database.models import Document
 from database.models.statuses import *
+from shared.cache import task_cache
 from shared.db import *
-from telegram_bot.routers.statuses import run_status_change
-from telegram_bot.utils.notifications import send_notify, notify_when_user_changed
-from telegram_bot.utils.send_tasks import broadcast_task
+from telegram_bot.utils.outbox import enqueue
 from webapp.deps import templates
 from webapp.schemas import TaskCreate
 
@@ -64,10 +62,11 @@ async def create_task(
         task_create = TaskCreate(**task_data)
         new_task = Task(**task_create.model_dump())
         db.add(new_task)
-        await db.commit()
-        await db.refresh(new_task)
+        await db.flush()
         if status_enum != Statuses.DRAFT:
-            asyncio.ensure_future(send_notify(task=new_task, event_msg="Новая задача"))
+            # уведомление сохраняется в той же транзакции, что и задача
+            enqueue(db, 'notify', new_task.id, event_msg="Новая задача")
+        await db.commit()
     except (ValidationError, Exception) as e:
         common_data = await get_task_edit_common_data(db)
         errors = e.errors() if isinstance(e, ValidationError) else [{"msg": str(e), "loc": ["database"]}]
@@ -83,7 +82,7 @@ async def create_task(
 
 
 @router.get("", response_class=HTMLResponse)
-async def list_tasks(request: Request, db: AsyncSession = Depends(get_db)):
+async def list_tasks(request: Request, db: AsyncSession = Depends(get_read_db)):
     user = request.state.user
     tasks = await get_user_tasks(user.id, db)
 
@@ -93,15 +92,34 @@ async def list_tasks(request: Request, db: AsyncSession = Depends(get_db)):
     })
 
 
+@router.get("/search", response_class=HTMLResponse)
+async def search(request: Request, q: str = Query(''), page: int = Query(1, ge=1, le=search_max_page()),
+                 db: AsyncSession = Depends(get_read_db)):
+    # номер задачи ищем напрямую, как в боте
+    if q.strip().lstrip('#').isdigit():
+        return RedirectResponse(url=request.url_for('view_task', task_id=int(q.strip().lstrip('#'))))
+    results, has_next = await search_tasks(q, page, db=db)
+    return templates.TemplateResponse("tasks_search.html", {
+        "request": request,
+        "title": "Поиск задач",
+        "q": q,
+        "results": results,
+        "page": page,
+        "has_next": has_next
+    })
+
+
 @router.get("/{task_id}", response_class=HTMLResponse)
 async def view_task(request: Request, task_id: int, db: AsyncSession = Depends(get_db)):
-    task = await get_task_by_id(task_id, db)
+    # вся история задачи не нужна: комментарии грузятся страницами, см. task_comments
+    task = await db.get(Task, task_id)
 
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
+    comments, next_cursor = await get_task_comments_page(task_id, db=db)
 
     # common_data = await get_task_edit_common_data(db)
-    users = (await db.execute(select(User).filter(User.active == True).order_by(User.last_name))).scalars().all()
+    users = await get_active_users()
     permission = task.user_permission(request.state.user.id)
     available_statuses_dict = {status.name: status.value for status in permission.available_statuses}
 
@@ -115,7 +133,23 @@ async def view_task(request: Request, task_id: int, db: AsyncSession = Depends(g
         "available_statuses": available_statuses_dict,
         "can_change_status": len(permission.available_statuses) > 0,
         "title": f"Задача {task.id}: {task.task_type.name}",
-        "CommentType": CommentType
+        "CommentType": CommentType,
+        "comments": comments,
+        "next_cursor": next_cursor
+    })
+
+
+@router.get("/{task_id}/comments", response_class=HTMLResponse)
+async def task_comments(request: Request, task_id: int, before: int, db: AsyncSession = Depends(get_read_db)):
+    # фрагмент ленты для кнопки "Показать более ранние"
+    comments, next_cursor = await get_task_comments_page(task_id, before=before, db=db)
+    return templates.TemplateResponse("task_view_comments.html", {
+        "request": request,
+        "task_id": task_id,
+        "Statuses": Statuses,
+        "CommentType": CommentType,
+        "comments": comments,
+        "next_cursor": next_cursor
     })
 
 
@@ -142,8 +176,9 @@ async def update_plan_date(
 
     await date_change(task, request.state.user, new_plan_date, executor_comment, db=db)
 
-    asyncio.ensure_future(send_notify(task=task, may_edit=True, full_refresh=True,
-                                      event_msg=f"Смена плановой даты задачи на\n{task.formatted_plan_date}"))
+    enqueue(db, 'notify', task.id, may_edit=True, full_refresh=True,
+            event_msg=f"Смена плановой даты задачи на\n{task.formatted_plan_date}")
+    await db.commit()
     return RedirectResponse(url=f"/tasks/{task_id}", status_code=303)
 
 
@@ -230,8 +265,10 @@ async def update_role(
             }
         )
         db.add(user_change_comment)
+        await refresh_recent_activity(task.id, db)
+        enqueue(db, 'user_changed', task.id, old_user_id=old_user.id, new_user_id=new_user.id, role=role.name)
         await db.commit()
-        asyncio.ensure_future(notify_when_user_changed(task=task, old_user=old_user, new_user=new_user, role=role))
+        await task_cache.invalidate(task.id)
 
     return RedirectResponse(url=f"/tasks/{task_id}", status_code=303)
 
@@ -250,8 +287,6 @@ async def update_task_status(
 
     user = request.state.user
     new_status = Statuses[new_status]
-    if new_status == Statuses.REWORK:
-        task.rework_count += 1
 
     if new_status in SHOULD_BE_COMMENTED and not status_comment:
         raise HTTPException(status_code=400, detail="Комментарий обязателен для этого статуса")
@@ -260,11 +295,14 @@ async def update_task_status(
     if not is_valid_transition(task.status, new_status, user_roles):
         raise HTTPException(status_code=400, detail="Недопустимый перевод статуса")
 
-    await db.commit()
-    await db.refresh(task)
-    previously_notified = task.whom_notify()
-    asyncio.ensure_future(run_status_change(task, previously_notified, new_status,
-                                            comment=status_comment))
+    # карточку прежнего ответственного снимают вместе с уведомлением о смене статуса
+    previously_notified = task.whom_notify() or user
+    previous_status = task.status
+    # status_change сам увеличивает rework_count
+    if await status_change(task, user, new_status, status_comment, user_roles, db):
+        enqueue(db, 'status_changed', task.id, user_id=previously_notified.id,
+                previous_status=previous_status.name, new_status=new_status.name)
+        await db.commit()
 
     return RedirectResponse(url=f"/tasks/{task_id}", status_code=303)
 
@@ -306,8 +344,10 @@ async def add_comment_web(
                     comment_id=new_comment.id
                 )
                 db.add(new_document)
+        await refresh_recent_activity(task.id, db)
 
+    enqueue(db, 'broadcast', task.id, comment="Новый комментарий по задаче")
     await db.commit()
+    await task_cache.invalidate(task.id)
     await db.refresh(new_comment)
-    asyncio.ensure_future(broadcast_task(task, "Новый комментарий по задаче"))
     return RedirectResponse(url=f"/tasks/{task_id}", status_code=303)
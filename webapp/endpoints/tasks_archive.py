@@ -1,21 +1,31 @@
+import asyncio
+import codecs
+import csv
+import io
+import os
+import tempfile
 from collections import OrderedDict
-from datetime import datetime
-from io import BytesIO
+from datetime import date, datetime
+from typing import Optional, AsyncIterator, Literal, Any
 
+import aiofiles
 import openpyxl
-from fastapi import APIRouter, Depends, Request, Query
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, Request, Query, HTTPException
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Alignment
+from openpyxl.utils import get_column_letter
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, case, and_, or_, true
 from starlette.responses import HTMLResponse
 
-from database import get_db
+from database import get_read_db, get_read_db_safety
 from database.models import Task
 from database.models.statuses import COMPLETED_STATUSES, Statuses
 from webapp.deps import templates
+from webapp.utils.export_jobs import ExportJob, ExportWriter, export_jobs
 
 router = APIRouter()
 
@@ -24,9 +34,62 @@ tab_filters = {
     'important': {'name': 'Важные', 'filter': Task.important == True},
     'completed': {'name': 'Завершенные', 'filter': Task.status == Statuses.DONE},
     'canceled': {'name': 'Отмененные', 'filter': Task.status == Statuses.CANCELED},
-    'all': {'name': 'Все', 'filter': True}
+    'all': {'name': 'Все', 'filter': true()}
 }
 
+# колонки, по которым архив можно сортировать; под каждую есть индекс (колонка, id).
+# Описание (TEXT) и статус (ENUM в MariaDB сортируется по номеру, а сравнивается как строка)
+# для keyset-пагинации не годятся
+SORT_COLUMNS = {
+    'id': Task.id,
+    'time_updated': Task.time_updated,
+    'actual_plan_date': Task.actual_plan_date,
+    'task_type_id': Task.task_type_id,
+    'object_id': Task.object_id,
+    'supplier_id': Task.supplier_id,
+    'supervisor_id': Task.supervisor_id,
+    'executor_id': Task.executor_id,
+}
+
+
+def encode_cursor(task: Task, column) -> str:
+    # курсор хранит сами значения ключа сортировки (column, id): страница строится,
+    # даже если задача-курсор удалена или ушла из вкладки
+    value = getattr(task, column.key)
+    if isinstance(value, date):
+        value = value.isoformat()
+    return f"{value}|{task.id}"
+
+
+def decode_cursor(cursor: str, column) -> tuple[Any, int]:
+    raw_value, _, raw_id = cursor.rpartition('|')
+    try:
+        python_type = column.type.python_type
+        if python_type in (date, datetime):
+            value = python_type.fromisoformat(raw_value)
+        else:
+            value = python_type(raw_value)
+        return value, int(raw_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор страницы")
+
+
+def seek_after(column, cursor: str, descending: bool):
+    # позиция курсора в порядке (column, id)
+    value, task_id = decode_cursor(cursor, column)
+    if column is Task.id:
+        return Task.id < task_id if descending else Task.id > task_id
+    if descending:
+        return or_(column < value, and_(column == value, Task.id < task_id))
+    return or_(column > value, and_(column == value, Task.id > task_id))
+
+
+async def get_tab_counts(db: AsyncSession) -> dict:
+    # все счётчики вкладок одним проходом: COUNT(CASE WHEN <фильтр> THEN 1 END)
+    query = select(*[func.count(case((value['filter'], 1))).label(key) for key, value in tab_filters.items()])
+    counts = (await db.execute(query)).one()._asdict()
+    return {key: {'name': value['name'], 'count': counts[key]} for key, value in tab_filters.items()}
+
 
 @router.get("", response_class=HTMLResponse)
 async def task_archive(
@@ -34,32 +97,48 @@ async def task_archive(
         status_filter: str = Query('active'),
         sort_column: str = Query('time_updated'),
         sort_order: str = Query('desc'),
+        after: Optional[str] = Query(None),
+        before: Optional[str] = Query(None),
         page: int = Query(1, ge=1),
         page_size: int = Query(30, ge=1),
-        db: AsyncSession = Depends(get_db)
+        db: AsyncSession = Depends(get_read_db)
 ):
-    offset = (page - 1) * page_size
-    sort_column_attr = getattr(Task, sort_column, Task.time_updated)
+    if status_filter not in tab_filters:
+        status_filter = 'active'
+    if sort_column not in SORT_COLUMNS:
+        sort_column = 'time_updated'
+    sort_column_attr = SORT_COLUMNS[sort_column]
+    descending = sort_order == 'desc'
 
-    filter_condition = tab_filters[status_filter]['filter']
-    base_query = select(Task).options(
+    query = select(Task).options(
         joinedload(Task.task_type),
         joinedload(Task.object)
-    ).filter(filter_condition)
-
-    count_query = select(func.count(Task.id)).filter(filter_condition)
-    base_query = base_query.order_by(sort_column_attr.desc() if sort_order == 'desc' else sort_column_attr.asc())
-    base_query = base_query.offset(offset).limit(page_size)
-
-    result = await db.execute(base_query)
-    tasks = result.scalars().all()
+    ).filter(tab_filters[status_filter]['filter'])
 
-    total = await db.scalar(count_query)
+    # назад идём в обратном порядке от первой задачи страницы и разворачиваем результат
+    backwards = before is not None
+    if backwards:
+        query = query.filter(seek_after(sort_column_attr, before, not descending))
+    elif after is not None:
+        query = query.filter(seek_after(sort_column_attr, after, descending))
+    if descending != backwards:
+        query = query.order_by(sort_column_attr.desc(), Task.id.desc())
+    else:
+        query = query.order_by(sort_column_attr.asc(), Task.id.asc())
+    # лишняя строка показывает, есть ли ещё страница в направлении движения
+    tasks = list((await db.execute(query.limit(page_size + 1))).scalars().all())
+    has_more = len(tasks) > page_size
+    tasks = tasks[:page_size]
+    if backwards:
+        tasks.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = after is not None, has_more
+    if not has_prev:
+        page = 1
 
-    tab_data = {}
-    for key, value in tab_filters.items():
-        total_count = await db.scalar(select(func.count(Task.id)).filter(value['filter']))
-        tab_data[key] = {'name': value['name'], 'count': total_count}
+    tab_data = await get_tab_counts(db)
+    total = tab_data[status_filter]['count']
 
     return templates.TemplateResponse("tasks_archive.html", {
         "request": request,
@@ -69,8 +148,14 @@ async def task_archive(
         "sort_order": sort_order,
         "page": page,
         "page_size": page_size,
+        "pages": max((total + page_size - 1) // page_size, 1),
+        "has_prev": has_prev,
+        "has_next": has_next,
+        "prev_cursor": encode_cursor(tasks[0], sort_column_attr) if tasks else None,
+        "next_cursor": encode_cursor(tasks[-1], sort_column_attr) if tasks else None,
         "total": total,
-        "tab_data": tab_data
+        "tab_data": tab_data,
+        "sort_columns": SORT_COLUMNS
     })
 
 
@@ -96,62 +181,184 @@ TABLE_EXPORT_COLUMNS = OrderedDict([
 ])
 
 
-@router.get("/export", response_class=StreamingResponse, name="export_tasks_to_excel")
-async def export_tasks_to_excel(db: AsyncSession = Depends(get_db)):
-    query = select(Task).options(
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_MIN_WIDTH = 10
+# ширина столбцов задаётся заранее: в потоковом режиме второго прохода по ячейкам нет
+EXPORT_COLUMN_WIDTHS = {'description': 60, 'task_type.name': 25, 'object.name': 25,
+                        'supplier.full_name': 30, 'supervisor.full_name': 30, 'executor.full_name': 30}
+EXPORT_MEDIA_TYPES = {
+    'xlsx': "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    'csv': "text/csv; charset=utf-8",
+}
+
+
+def export_query(status_filter: str, sort_column: str, sort_order: str):
+    column = SORT_COLUMNS.get(sort_column, Task.time_updated)
+    order = (column.desc(), Task.id.desc()) if sort_order == 'desc' else (column.asc(), Task.id.asc())
+    return select(Task).options(
         joinedload(Task.task_type),
         joinedload(Task.object)
-    )
-    result = await db.execute(query)
-    tasks = result.scalars().all()
-
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Все задачи"
-
-    headers = list(TABLE_EXPORT_COLUMNS.values())
-    sheet.append(headers)
-
-    for task in tasks:
-        row = []
-        for col in TABLE_EXPORT_COLUMNS.keys():
-            try:
-                value = getattr(task, col.split('.')[0], None)
-                if '.' in col:
-                    nested_attr = col.split('.')[1]
-                    value = getattr(value, nested_attr, None)
-                if isinstance(value, datetime):
-                    if 'date' in col:
-                        value = value.strftime("%Y-%m-%d")
-                    else:
-                        value = value.strftime("%Y-%m-%d %H:%M:%S")
-                if value is None:
-                    value = ''
-            except AttributeError:
+    ).filter(tab_filters.get(status_filter, tab_filters['all'])['filter']).order_by(*order)
+
+
+def export_row(task: Task) -> list:
+    row = []
+    for col in TABLE_EXPORT_COLUMNS.keys():
+        try:
+            value = getattr(task, col.split('.')[0], None)
+            if '.' in col:
+                nested_attr = col.split('.')[1]
+                value = getattr(value, nested_attr, None)
+            if isinstance(value, datetime):
+                if 'date' in col:
+                    value = value.strftime("%Y-%m-%d")
+                else:
+                    value = value.strftime("%Y-%m-%d %H:%M:%S")
+            if value is None:
                 value = ''
-            row.append(value)
+        except AttributeError:
+            value = ''
+        row.append(value)
+    return row
+
+
+async def iter_export_rows(status_filter: str, sort_column: str, sort_order: str,
+                           db: AsyncSession = None) -> AsyncIterator[list[list]]:
+    """
+    Строки выгрузки пачками по EXPORT_CHUNK_SIZE через серверный курсор.
+    Сессия своя: ответ отдаётся уже после того, как закрыта сессия запроса.
+    Identity map держит объекты по слабым ссылкам, так что обработанные пачки не копятся.
+    """
+    async with get_read_db_safety(db) as db:
+        query = export_query(status_filter, sort_column, sort_order).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+        result = await db.stream(query)
+        async for tasks in result.scalars().partitions():
+            yield [export_row(task) for task in tasks]
+
+
+async def stream_csv(rows: AsyncIterator[list[list]]) -> AsyncIterator[bytes]:
+    # BOM и ';' - чтобы Excel с русской локалью открывал файл без мастера импорта
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    writer.writerow(TABLE_EXPORT_COLUMNS.values())
+    yield codecs.BOM_UTF8 + buffer.getvalue().encode()
+    async for chunk in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+
+
+def new_export_workbook() -> tuple[openpyxl.Workbook, Any]:
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Все задачи")
+    for n, (col, header) in enumerate(TABLE_EXPORT_COLUMNS.items(), start=1):
+        width = EXPORT_COLUMN_WIDTHS.get(col, max(len(header) + 2, EXPORT_MIN_WIDTH))
+        sheet.column_dimensions[get_column_letter(n)].width = width
+    sheet.append([WriteOnlyCell(sheet, header) for header in TABLE_EXPORT_COLUMNS.values()])
+    return workbook, sheet
+
+
+def append_export_rows(sheet, rows: list[list]):
+    wrap = Alignment(wrap_text=True)
+    description = list(TABLE_EXPORT_COLUMNS).index('description')
+    for row in rows:
+        cell = WriteOnlyCell(sheet, row[description])
+        cell.alignment = wrap
+        row[description] = cell
         sheet.append(row)
 
-    MIN_WIDTH = 10
-    for col in sheet.columns:
-        max_length = MIN_WIDTH
-        column = col[0].column_letter
-        for n, cell in enumerate(col):
-            cell.alignment = Alignment(wrap_text=True)
-            if not n:
-                continue
-            try:
-                if cell.value:
-                    max_length = max(max_length, len(str(cell.value)))
-            except:
-                pass
-        adjusted_width = max(max_length + 2, MIN_WIDTH)
-        sheet.column_dimensions[column].width = adjusted_width
-
-    buffer = BytesIO()
-    workbook.save(buffer)
-    buffer.seek(0)
-
-    response = StreamingResponse(buffer, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-    response.headers["Content-Disposition"] = "attachment; filename=tasks.xlsx"
+
+async def write_xlsx(rows: AsyncIterator[list[list]], path: str):
+    # write-only книга сбрасывает строки во временный файл, память не растёт с числом задач;
+    # работа openpyxl идёт в потоке, чтобы не блокировать event loop
+    workbook, sheet = await asyncio.to_thread(new_export_workbook)
+    async for chunk in rows:
+        await asyncio.to_thread(append_export_rows, sheet, chunk)
+    await asyncio.to_thread(workbook.save, path)
+
+
+async def write_csv(rows: AsyncIterator[list[list]], path: str):
+    async with aiofiles.open(path, 'wb') as file:
+        async for data in stream_csv(rows):
+            await file.write(data)
+
+
+async def track_progress(rows: AsyncIterator[list[list]], job: ExportJob) -> AsyncIterator[list[list]]:
+    async for chunk in rows:
+        yield chunk
+        job.done_rows += len(chunk)
+
+
+def export_writer(status_filter: str, sort_column: str, sort_order: str, format: str) -> ExportWriter:
+    async def write(job: ExportJob, path):
+        async with get_read_db_safety() as db:
+            job.total = await db.scalar(select(func.count(Task.id)).filter(tab_filters[status_filter]['filter']))
+        rows = track_progress(iter_export_rows(status_filter, sort_column, sort_order), job)
+        await (write_csv if format == 'csv' else write_xlsx)(rows, path)
+
+    return write
+
+
+def export_job_response(request: Request, job: ExportJob) -> JSONResponse:
+    data = job.to_dict()
+    if job.status == 'done':
+        data['download_url'] = str(request.url_for('download_export', job_id=job.id))
+    return JSONResponse(data)
+
+
+async def stream_xlsx(rows: AsyncIterator[list[list]]) -> AsyncIterator[bytes]:
+    # xlsx - это zip, собрать его можно только целиком, поэтому отдаём из временного файла
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        await write_xlsx(rows, path)
+        async with aiofiles.open(path, 'rb') as file:
+            while data := await file.read(64 * 1024):
+                yield data
+    finally:
+        os.remove(path)
+
+
+@router.get("/export", response_class=StreamingResponse, name="export_tasks_to_excel")
+async def export_tasks_to_excel(
+        request: Request,
+        status_filter: str = Query('all'),
+        sort_column: str = Query('time_updated'),
+        sort_order: str = Query('desc'),
+        format: Literal['xlsx', 'csv'] = Query('xlsx'),
+        background: bool = Query(False)
+):
+    if background:
+        # параметры приводим к каноническому виду: от них зависит повторное использование файла
+        params = {
+            'status_filter': status_filter if status_filter in tab_filters else 'all',
+            'sort_column': sort_column if sort_column in SORT_COLUMNS else 'time_updated',
+            'sort_order': 'asc' if sort_order == 'asc' else 'desc',
+            'format': format,
+        }
+        job = export_jobs.start(params, format, export_writer(**params))
+        return export_job_response(request, job)
+
+    rows = iter_export_rows(status_filter, sort_column, sort_order)
+    content = stream_csv(rows) if format == 'csv' else stream_xlsx(rows)
+    response = StreamingResponse(content, media_type=EXPORT_MEDIA_TYPES[format])
+    response.headers["Content-Disposition"] = f"attachment; filename=tasks.{format}"
     return response
+
+
+@router.get("/export/jobs/{job_id}", name="export_job_status")
+async def export_job_status(request: Request, job_id: str):
+    job = export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Выгрузка не найдена или устарела")
+    return export_job_response(request, job)
+
+
+@router.get("/export/jobs/{job_id}/download", response_class=FileResponse, name="download_export")
+async def download_export(job_id: str):
+    job = export_jobs.get(job_id)
+    if not job or job.status != 'done' or not job.path.exists():
+        raise HTTPException(status_code=404, detail="Выгрузка не найдена или устарела")
+    return FileResponse(job.path, media_type=EXPORT_MEDIA_TYPES[job.params['format']],
+                        filename=f"tasks.{job.params['format']}")
@@ -10,6 +10,7 @@ from sqlalchemy.future import select
 
 from database import get_db
 from database.models import User
+from shared.cache import reference_cache, user_cache
 from telegram_bot.utils.get_user_photo import get_user_avatar
 from webapp.deps import templates
 from webapp.schemas import UserSchema
@@ -124,6 +125,8 @@ async def save_user(request: Request, user_id: int = None, db: AsyncSession = De
     if not user_id:
         db.add(user)
     await db.commit()
+    reference_cache.invalidate('users')
+    user_cache.invalidate(user.telegram_id)
     await db.refresh(user)
     return RedirectResponse(url="/users", status_code=303)
 
@@ -148,4 +151,6 @@ async def user_action(request: Request, user_id: int, action: str, db: AsyncSess
         raise HTTPException(status_code=400, detail="Invalid action")
 
     await db.commit()
+    reference_cache.invalidate('users')
+    user_cache.invalidate(user.telegram_id)
     return RedirectResponse(url="/users", status_code=303)
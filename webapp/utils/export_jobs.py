@@ -0,0 +1,117 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from shared.app_config import app_config
+
+logger = logging.getLogger(__name__)
+
+EXPORT_TTL = 3600  # готовый файл отдаётся повторно в течение часа
+
+
+@dataclass
+class ExportJob:
+    id: str
+    params: dict
+    path: Path
+    status: str = 'running'  # running | done | failed
+    total: Optional[int] = None
+    done_rows: int = 0
+    error: Optional[str] = None
+    finished_at: Optional[float] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def expired(self) -> bool:
+        return self.status != 'running' and time.time() - (self.finished_at or 0) > EXPORT_TTL
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'total': self.total,
+            'done_rows': self.done_rows,
+            'progress': round(self.done_rows / self.total * 100) if self.total else None,
+            'error': self.error,
+        }
+
+
+# пишет файл выгрузки по пути, заполняет job.total и двигает job.done_rows
+ExportWriter = Callable[[ExportJob, Path], Awaitable[None]]
+
+
+class ExportJobs:
+    """
+    Фоновые выгрузки: задание выполняется отдельной asyncio-задачей, готовый файл лежит
+    в export_dir (APP_EXPORT_DIR) до истечения EXPORT_TTL, каталог создаётся при первой выгрузке.
+    Одинаковые параметры дают тот же id задания, поэтому повторный запрос получает
+    уже идущее задание или готовый файл. Состояние заданий хранится в процессе, файлы переживают перезапуск.
+    """
+
+    def __init__(self, export_dir: str | Path):
+        self.export_dir = Path(export_dir)
+        self._jobs: dict[str, ExportJob] = {}
+
+    @staticmethod
+    def job_id(params: dict) -> str:
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+    def start(self, params: dict, suffix: str, writer: ExportWriter) -> ExportJob:
+        self.cleanup()
+        job_id = self.job_id(params)
+        job = self._jobs.get(job_id)
+        if job and job.status != 'failed':
+            return job
+        self.export_dir.mkdir(parents=True, exist_ok=True)
+        path = self.export_dir / f"{job_id}.{suffix}"
+        job = ExportJob(job_id, params, path)
+        # файл от прошлого запуска приложения, ещё не устаревший
+        if path.exists() and time.time() - path.stat().st_mtime <= EXPORT_TTL:
+            job.status, job.finished_at = 'done', path.stat().st_mtime
+        else:
+            # задание живёт дольше запроса: не наследуем его контекст (сессию БД, счётчик запросов)
+            job.task = contextvars.Context().run(asyncio.create_task, self._run(job, writer))
+        self._jobs[job_id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        self.cleanup()
+        return self._jobs.get(job_id)
+
+    async def _run(self, job: ExportJob, writer: ExportWriter):
+        partial = job.path.with_name(job.path.name + '.part')
+        try:
+            await writer(job, partial)
+            os.replace(partial, job.path)
+            job.status = 'done'
+        except Exception as e:
+            logger.exception(f"Export {job.id} failed")
+            job.status, job.error = 'failed', str(e)
+            if partial.exists():
+                os.remove(partial)
+        finally:
+            job.finished_at = time.time()
+            job.task = None
+
+    def cleanup(self):
+        for job_id, job in list(self._jobs.items()):
+            if job.expired:
+                del self._jobs[job_id]
+        if not self.export_dir.is_dir():
+            return
+        # файлы без задания в памяти: после перезапуска или оставшиеся от упавших выгрузок
+        for path in self.export_dir.iterdir():
+            if path.stem.split('.')[0] in self._jobs:
+                continue
+            if time.time() - path.stat().st_mtime > EXPORT_TTL:
+                path.unlink(missing_ok=True)
+
+
+export_jobs = ExportJobs(app_config.export_dir)